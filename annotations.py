@@ -0,0 +1,118 @@
+import numpy as np
+import loader
+
+# the annotation columns (PG.ProteinGroups, PG.Genes) as integer codes
+# every distinct string is kept once (sorted, so a code is also the
+#  position for np.searchsorted) and each row holds codes into it:
+#  - group / gene: the whole cell, e.g. 'A0A075B6P5;P01615'
+#  - accession / symbol: the ';'-separated parts of the cells, stored
+#    flat with offsets per row (row i owns parts offsets[i]:offsets[i+1])
+# names -> codes go through dicts (O(1)), codes -> rows through arrays,
+#  so labels, set membership and joins work on integers and only turn
+#  into strings when something is drawn or written out
+
+
+# split every cell on sep in one go
+# returns the parts, the row of each part and the offsets of each row
+def split_multi(values, sep=';'):
+    values = np.asarray(values, dtype=str)
+    counts = np.char.count(values, sep) + 1
+    parts = np.array(sep.join(values.tolist()).split(sep), dtype=str)
+    rows = np.repeat(np.arange(len(values)), counts)
+    return parts, rows, np.r_[0, np.cumsum(counts)]
+
+
+# codes of the distinct strings, their rows grouped by code (csr) and a
+#  dict name -> code
+def _intern(values, rows):
+    names, codes = np.unique(values, return_inverse=True)
+    codes = codes.ravel()
+    order = np.argsort(codes, kind='stable')
+    starts = np.searchsorted(codes[order], np.arange(len(names) + 1))
+    lookup = {n: i for i, n in enumerate(names.tolist())}
+    return names, codes, rows[order], starts, lookup
+
+
+class AnnotationTable:
+
+    def __init__(self, annot):
+        annot = np.asarray(annot, dtype=str)
+        self.n_rows = len(annot)
+        rows = np.arange(self.n_rows)
+
+        (self.group_names, self.group_codes, self._group_rows,
+         self._group_starts, self._group_code) = _intern(annot[:, 0], rows)
+        (self.gene_names, self.gene_codes, self._gene_rows,
+         self._gene_starts, self._gene_code) = _intern(annot[:, 1], rows)
+
+        parts, part_rows, self.acc_offsets = split_multi(annot[:, 0])
+        (self.accessions, self.acc_codes, self._acc_rows,
+         self._acc_starts, self._acc_code) = _intern(parts, part_rows)
+        parts, part_rows, self.sym_offsets = split_multi(annot[:, 1])
+        (self.symbols, self.sym_codes, self._sym_rows,
+         self._sym_starts, self._sym_code) = _intern(parts, part_rows)
+
+    @classmethod
+    def from_csv(cls, csv_path, n_annot=loader.N_ANNOT):
+        return cls(loader.load_matrix(csv_path, mmap=True,
+                                      n_annot=n_annot)[1])
+
+    # plot labels: the first accession of each row's group,
+    #  e.g. 'P01834;A0A0A0MS08' -> 'P01834' (as loader.first_names)
+    def labels(self, rows=None):
+        codes = self.acc_codes[self.acc_offsets[:-1]]
+        if rows is not None:
+            codes = codes[rows]
+        return self.accessions[codes]
+
+    def groups(self, rows=None):
+        codes = self.group_codes if rows is None else self.group_codes[rows]
+        return self.group_names[codes]
+
+    def genes(self, rows=None):
+        codes = self.gene_codes if rows is None else self.gene_codes[rows]
+        return self.gene_names[codes]
+
+    # rows whose whole protein group / gene cell is name
+    def rows_of_group(self, name):
+        return self._rows(self._group_code, self._group_rows,
+                          self._group_starts, name)
+
+    def rows_of_gene(self, name):
+        return self._rows(self._gene_code, self._gene_rows,
+                          self._gene_starts, name)
+
+    # rows with the accession or gene symbol name in their group
+    def rows(self, name):
+        out = self._rows(self._acc_code, self._acc_rows, self._acc_starts,
+                         name)
+        if len(out) == 0:
+            out = self._rows(self._sym_code, self._sym_rows,
+                             self._sym_starts, name)
+        return out
+
+    @staticmethod
+    def _rows(lookup, rows, starts, name):
+        code = lookup.get(name)
+        if code is None:
+            return np.empty(0, dtype=int)
+        return rows[starts[code]:starts[code + 1]]
+
+    # group codes of many group strings at once, -1 if not in the table
+    def group_codes_of(self, names):
+        names = np.asarray(names, dtype=str)
+        if len(self.group_names) == 0:
+            return np.full(len(names), -1)
+        idx = np.minimum(np.searchsorted(self.group_names, names),
+                         len(self.group_names) - 1)
+        return np.where(self.group_names[idx] == names, idx, -1)
+
+    # for every row here, the first row of other with the same protein
+    #  group (-1 if other doesn't have it); joins results of two tables
+    def join(self, other):
+        if other.n_rows == 0:
+            return np.full(self.n_rows, -1)
+        codes = other.group_codes_of(self.group_names)
+        first = other._group_rows[other._group_starts[:-1]]
+        out = np.where(codes >= 0, first[np.maximum(codes, 0)], -1)
+        return out[self.group_codes]
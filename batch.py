@@ -0,0 +1,155 @@
+import os
+import sys
+import csv
+import math
+import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import pipeline
+
+# the whole analysis (protein counts, rainclouds, upset, volcano) for
+#  many datasets against one metadata file, e.g.
+#   python batch.py R_testing R_testing/Metadata-Example-2.csv
+#   python batch.py 'exports/bmif-*.csv' meta.csv --out-dir figures
+# every dataset is one pipeline.run (see pipeline.py) in a process of
+#  its own, a few at a time; its figures go to <out_dir>/<name>/ and
+#  its cache to <name>.store next to it, so a dataset that hasn't changed
+#  since the last batch is read from the cache
+# a dataset that fails (missing, empty, headers only, no matching
+#  columns, ...) is reported with its error and doesn't stop the others,
+#  nor does one whose process dies
+
+
+# csv files in a directory, or matching a glob, sorted; metadata files
+#  are left out: any csv whose header has the metadata column, and the
+#  metadata file and those named after it (Metadata-Example-2_NA.csv, ...)
+def datasets(pattern, meta_path=None, meta_col='Columns'):
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.csv')
+    paths = [p for p in sorted(glob.glob(pattern))
+             if not is_metadata(p, meta_col)]
+    if meta_path is not None:
+        meta = os.path.splitext(os.path.abspath(meta_path))[0]
+        paths = [p for p in paths
+                 if not os.path.abspath(p).startswith(meta)]
+    return paths
+
+
+def is_metadata(path, meta_col='Columns'):
+    try:
+        with open(path, newline='') as f:
+            header = next(csv.reader(f), [])
+    except (OSError, UnicodeDecodeError, csv.Error):
+        return False
+    return meta_col in header
+
+
+def dataset_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# one dataset, in a worker
+# returns {'path', 'status' ('ok' or 'failed'), 'seconds', 'message',
+#  'paths', 'notes'}; any error is caught and comes back as the message
+def run_one(task):
+    data_path, meta_path, out_dir, params = task
+    start = time.perf_counter()
+    out = {'path': data_path, 'paths': [], 'notes': []}
+    try:
+        result = pipeline.run(data_path, meta_path, verbose=False,
+                              out_dir=os.path.join(out_dir,
+                                                   dataset_name(data_path)),
+                              **params)
+        notes = result['validate']['notes']
+        out['notes'] = notes
+        out['status'] = 'ok'
+        out['paths'] = result['plot']['paths']
+        out['message'] = '{} file(s){}'.format(
+            len(out['paths']),
+            '; {} note(s)'.format(len(notes)) if notes else '')
+    except Exception as e:
+        out['status'] = 'failed'
+        out['message'] = '{}: {}'.format(type(e).__name__, e)
+    out['seconds'] = time.perf_counter() - start
+    return out
+
+
+def failed(task, error):
+    return {'path': task[0], 'status': 'failed', 'seconds': float('nan'),
+            'paths': [], 'notes': [], 'message': '{}: {}'.format(type(error).__name__,
+                                                    error)}
+
+
+# every task in a single-worker pool of its own, processes of them at a
+#  time, so a worker that dies (and breaks its pool) takes only its own
+#  dataset with it
+def run_each(tasks, processes):
+    reports = [None] * len(tasks)
+    waiting = list(enumerate(tasks))[::-1]
+    running = {}
+    while waiting or running:
+        while waiting and len(running) < processes:
+            i, task = waiting.pop()
+            pool = ProcessPoolExecutor(1)
+            running[pool.submit(run_one, task)] = (i, pool)
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            i, pool = running.pop(future)
+            try:
+                reports[i] = future.result()
+            except Exception as e:
+                reports[i] = failed(tasks[i], e)
+            pool.shutdown()
+    return reports
+
+
+# run every dataset matching pattern; params go to pipeline.run
+# processes: datasets run at once (default one per dataset, up to the
+#  number of cpus); each dataset renders its own figures in its process
+# returns one report per dataset, in dataset order; the notes of the
+#  input checks are printed afterwards, one dataset at a time
+def run_batch(pattern, meta_path, out_dir='batch', processes=None,
+              verbose=True, **params):
+    paths = datasets(pattern, meta_path)
+    if not paths:
+        raise ValueError('no datasets found for {!r}'.format(pattern))
+    params.setdefault('processes', 1)
+    tasks = [(p, meta_path, out_dir, params) for p in paths]
+    if processes is None:
+        processes = min(len(tasks), os.cpu_count() or 1)
+    reports = run_each(tasks, max(processes, 1))
+    if verbose:
+        for r in reports:
+            for note in r['notes']:
+                print('{}: note: {}'.format(dataset_name(r['path']), note))
+    return reports
+
+
+def print_summary(reports):
+    width = max(len(dataset_name(r['path'])) for r in reports)
+    for r in reports:
+        print('{:<{w}}  {:<6}  {:7.2f} s  {}'.format(
+            dataset_name(r['path']), r['status'], r['seconds'],
+            r['message'][:100], w=width))
+    ok = sum(r['status'] == 'ok' for r in reports)
+    print('{} of {} dataset(s) ok, {:.2f} s in total'.format(
+        ok, len(reports), sum(r['seconds'] for r in reports
+                              if not math.isnan(r['seconds']))))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='run the analysis for every dataset in a directory '
+                    'or matching a glob')
+    parser.add_argument('datasets', help='directory or glob of data csvs')
+    parser.add_argument('meta', help='metadata csv')
+    parser.add_argument('--out-dir', default='batch')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--fmt', default=pipeline.DEFAULTS['fmt'])
+    parser.add_argument('--analysis', default=pipeline.DEFAULTS['analysis'])
+    args = parser.parse_args()
+    reports = run_batch(args.datasets, args.meta, args.out_dir,
+                        args.processes, fmt=args.fmt, analysis=args.analysis)
+    print_summary(reports)
+    sys.exit(0 if all(r['status'] == 'ok' for r in reports) else 1)
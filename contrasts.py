@@ -0,0 +1,145 @@
+from itertools import combinations
+import numpy as np
+import stats
+
+# contrast engine
+# per-group sufficient statistics (n, sum, sum of squares) are worked out
+#  once; every contrast (fold change, t, p) is then derived from them, so
+#  the cost grows with the number of groups, not the number of contrasts
+
+
+# per-protein n, sum and sum of squares for each group
+# missing values are skipped, so n is the number of values present for
+#  each protein in each group
+# the sums are taken about a per-protein shift (the row mean over all
+#  groups) so the variance doesn't lose precision on raw intensities
+class GroupStats:
+
+    def __init__(self, keys, n, s, ss, shift):
+        self.keys = list(keys)
+        self.index = {k: i for i, k in enumerate(self.keys)}
+        self.n = n          # groups x proteins
+        self.s = s          # groups x proteins
+        self.ss = ss        # groups x proteins
+        self.shift = shift  # proteins
+
+    # blocks: {key: proteins x samples}, e.g. GroupIndex.reordered()
+    @classmethod
+    def from_blocks(cls, blocks):
+        keys = list(blocks)
+        values = list(blocks.values())
+        # rows with no values at all get a shift of 0
+        shift = np.nan_to_num(stats.nan_moments(np.hstack(values))[1])
+        n = np.empty((len(keys), len(shift)))
+        s = np.empty_like(n)
+        ss = np.empty_like(n)
+        for i, block in enumerate(values):
+            present = ~np.isnan(block)
+            d = np.where(present, block - shift[:, None], 0.0)
+            n[i] = present.sum(axis=1)
+            s[i] = d.sum(axis=1)
+            ss[i] = (d*d).sum(axis=1)
+        return cls(keys, n, s, ss, shift)
+
+    # add samples (proteins x samples) to the group key, or start a new
+    #  group with them; the shift stays as it is, so the sums of the
+    #  samples already in never need redoing
+    def add(self, key, block):
+        if key not in self.index:
+            self.index[key] = len(self.keys)
+            self.keys.append(key)
+            zeros = np.zeros((1, len(self.shift)))
+            self.n = np.vstack([self.n, zeros])
+            self.s = np.vstack([self.s, zeros])
+            self.ss = np.vstack([self.ss, zeros])
+        i = self.index[key]
+        present = ~np.isnan(block)
+        d = np.where(present, block - self.shift[:, None], 0.0)
+        self.n[i] += present.sum(axis=1)
+        self.s[i] += d.sum(axis=1)
+        self.ss[i] += (d*d).sum(axis=1)
+
+    # group mean, nan where a protein has no values in the group
+    def mean(self, key):
+        i = self.index[key]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.shift + self.s[i]/self.n[i]
+
+    # sample variance (ddof=1), nan with fewer than 2 values
+    def var(self, key):
+        i = self.index[key]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v = (self.ss[i] - self.s[i]**2/self.n[i]) / (self.n[i] - 1)
+        v[self.n[i] < 2] = np.nan
+        return np.maximum(v, 0.0)
+
+    # proteins with at least min_obs values in every one of the keys
+    def observed(self, keys, min_obs):
+        return np.all(self.n[[self.index[k] for k in keys]] >= min_obs,
+                      axis=0)
+
+
+# every pair of groups
+def all_pairwise(keys):
+    return list(combinations(keys, 2))
+
+
+# pairs of groups that differ in exactly one factor,
+#  e.g. ('BMIF','Dx') vs ('BMIF','D29') but not vs ('PB','D29')
+# ordered by the factor that differs, last factor first, so for
+#  Site x Timepoint the time contrasts come before the site contrasts
+def one_factor_contrasts(keys):
+    pairs = []
+    for a, b in combinations(keys, 2):
+        diff = [i for i, (x, y) in enumerate(zip(a, b)) if x != y]
+        if len(diff) == 1:
+            pairs.append((diff[0], (a, b)))
+    pairs.sort(key=lambda p: -p[0])
+    return [p[1] for p in pairs]
+
+
+# plot title for a contrast
+# ('BMIF','Dx') vs ('BMIF','D29') -> 'BMIF: Dx/D29'
+# groups differing in every factor -> 'BMIF, Dx/PB, D29'
+def contrast_label(a, b):
+    same = [x for x, y in zip(a, b) if x == y]
+    da = [x for x, y in zip(a, b) if x != y]
+    db = [y for x, y in zip(a, b) if x != y]
+    diff = '{}/{}'.format(', '.join(da), ', '.join(db))
+    if same:
+        return '{}: {}'.format(', '.join(same), diff)
+    return diff
+
+
+# fold change, t, df and p for every contrast, all proteins at once
+# returns {name: contrasts x proteins array}
+# logged=True: data are already log2, log2fc is the difference of means
+# logged=False: log2fc is log2 of the (absolute) ratio of means
+# proteins with fewer than min_obs values in either group of a contrast
+#  get nan for that contrast (min_obs is at least 2, for the variance)
+def run_contrasts(gstats, pairs, equal_var=False, logged=False, min_obs=2):
+    out = {k: np.empty((len(pairs), len(gstats.shift)))
+           for k in ('mean_a', 'mean_b', 'log2fc', 't', 'df', 'p')}
+    # means and variances are needed by many contrasts, take them once
+    means = {k: gstats.mean(k) for k in gstats.keys}
+    vars_ = {k: gstats.var(k) for k in gstats.keys}
+    for i, (a, b) in enumerate(pairs):
+        ia = gstats.index[a]
+        ib = gstats.index[b]
+        t, df, p = stats.ttest_from_stats(means[a], vars_[a], gstats.n[ia],
+                                          means[b], vars_[b], gstats.n[ib],
+                                          equal_var)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if logged:
+                fc = means[a] - means[b]
+            else:
+                fc = np.log2(np.absolute(means[a]/means[b]))
+        stats.apply_min_obs(gstats.n[ia], gstats.n[ib], max(min_obs, 2),
+                            t, df, p, fc)
+        out['mean_a'][i] = means[a]
+        out['mean_b'][i] = means[b]
+        out['log2fc'][i] = fc
+        out['t'][i] = t
+        out['df'][i] = df
+        out['p'][i] = p
+    return out
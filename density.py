@@ -0,0 +1,93 @@
+import numpy as np
+
+# densities and box statistics for many samples at once, from the
+#  histograms and quartiles in the QC table (see qc.py)
+# the KDE is the binned approximation: the histogram counts are
+#  convolved with a gaussian kernel by FFT, so the cost depends on the
+#  number of bins, not the number of proteins, and every sample is done
+#  in the same call (Wand 1994, doi:10.1080/10618600.1994.10474656)
+
+
+def bin_centers(edges):
+    return 0.5*(edges[:-1] + edges[1:])
+
+
+# Scott's rule bandwidth for each histogram row (as scipy's gaussian_kde
+#  and matplotlib's violinplot use by default)
+def scott_bandwidth(hist, edges):
+    c = bin_centers(edges)
+    n = hist.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m = hist @ c / n
+        var = hist @ (c*c) / n - m*m
+        return np.sqrt(np.maximum(var, 0.0) * n / (n - 1)) * n**(-1/5)
+
+
+# gaussian KDE of every histogram row (samples x bins), evaluated at the
+#  bin centres; rows are densities (integrate to 1 over the edges)
+# bw: bandwidth in data units, one per row or one for all (default Scott)
+def binned_kde(hist, edges, bw=None):
+    hist = np.atleast_2d(np.asarray(hist, dtype=float))
+    n_bins = hist.shape[1]
+    width = edges[1] - edges[0]
+    if bw is None:
+        bw = scott_bandwidth(hist, edges)
+    bw = np.broadcast_to(np.asarray(bw, dtype=float), (len(hist),))
+
+    # zero padding so the circular convolution doesn't wrap around
+    size = 2*n_bins
+    lag = np.arange(size)
+    lag = np.where(lag < n_bins, lag, lag - size) * width
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kernel = np.exp(-0.5*(lag[None, :] / bw[:, None])**2)
+        kernel /= kernel.sum(axis=1, keepdims=True)
+    dens = np.fft.irfft(np.fft.rfft(hist, size, axis=1) *
+                        np.fft.rfft(kernel, size, axis=1), size, axis=1)
+    dens = np.maximum(dens[:, :n_bins], 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return dens / (dens.sum(axis=1, keepdims=True) * width)
+
+
+# ax.bxp stats for the given samples from the QC table
+def box_stats(summary, cols, labels=None):
+    out = []
+    for i, c in enumerate(cols):
+        out.append({'med': summary['median'][c], 'q1': summary['q1'][c],
+                    'q3': summary['q3'][c], 'whislo': summary['whislo'][c],
+                    'whishi': summary['whishi'][c], 'fliers': [],
+                    'label': labels[i] if labels is not None else str(i + 1)})
+    return out
+
+
+# random subset of at most max_points of x
+def subsample(x, max_points, rng):
+    if len(x) <= max_points:
+        return x
+    return x[np.sort(rng.choice(len(x), max_points, replace=False))]
+
+
+# density-aware subset of at most max_points of x: values are binned and
+#  every bin keeps at most the same number of points, so the sparse tails
+#  keep all their points and only the dense middle is thinned
+def thin(x, max_points, rng, n_bins=100):
+    if len(x) <= max_points:
+        return x
+    span = np.ptp(x) or 1.0
+    b = np.floor((x - x.min()) / span * (n_bins - 1)).astype(int)
+    counts = np.bincount(b, minlength=n_bins)
+
+    # largest per-bin cap that stays within max_points (bisection, the
+    #  total kept only grows with the cap)
+    lo, hi = 0, counts.max()
+    while lo < hi:
+        cap = (lo + hi + 1) // 2
+        if np.minimum(counts, cap).sum() <= max_points:
+            lo = cap
+        else:
+            hi = cap - 1
+    cap = lo
+
+    # a random cap-sized pick from every bin
+    order = np.lexsort((rng.random(len(x)), b))
+    rank = np.arange(len(x)) - np.searchsorted(b[order], b[order], 'left')
+    return np.sort(x[order[rank < cap]])
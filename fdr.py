@@ -0,0 +1,69 @@
+import numpy as np
+
+# multiple-testing correction for many contrasts at once
+# p-values come in as an array (e.g. contrasts x proteins) and every row
+#  is corrected in one call; nan p-values (untested proteins) stay nan
+#  and don't count towards the number of tests
+#
+# methods:
+#  'bh'         - Benjamini-Hochberg (same as statsmodels 'fdr_bh')
+#  'by'         - Benjamini-Yekutieli (same as statsmodels 'fdr_by')
+#  'bonferroni' - Bonferroni
+#  'qvalue'     - Storey q-values, BH scaled by the estimated fraction
+#                 of true nulls (pi0) at a single lambda
+METHODS = ('bh', 'by', 'bonferroni', 'qvalue')
+
+
+# Storey's estimate of the fraction of true null hypotheses per row
+# p is 2-D (rows x tests), m the number of valid p-values per row
+def pi0(p, m, lam=0.5):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        est = np.sum(p > lam, axis=1) / ((1.0 - lam) * m)
+    return np.clip(np.nan_to_num(est, nan=1.0), 0.0, 1.0)
+
+
+# step-up adjustment on a 2-D array, one row at a time but all rows
+#  in the same array operations
+def _adjust_rows(p, method, lam):
+    n_rows, n = p.shape
+    order = np.argsort(p, axis=1)  # nan sorts last
+    ps = np.take_along_axis(p, order, axis=1)
+    valid = ~np.isnan(ps)
+    m = valid.sum(axis=1).astype(float)
+    rank = np.arange(1, n + 1, dtype=float)
+
+    if method == 'bonferroni':
+        q = ps * m[:, None]
+    else:
+        q = ps * m[:, None] / rank
+        if method == 'by':
+            # harmonic number for each row's own m
+            harmonic = np.concatenate([[0.0], np.cumsum(1.0/rank)])
+            q *= harmonic[m.astype(int)][:, None]
+        elif method == 'qvalue':
+            q *= pi0(p, m, lam)[:, None]
+        # running minimum from the largest p-value down
+        q = np.where(valid, q, np.inf)
+        q = np.minimum.accumulate(q[:, ::-1], axis=1)[:, ::-1]
+    q = np.where(valid, np.minimum(q, 1.0), np.nan)
+
+    out = np.empty_like(q)
+    np.put_along_axis(out, order, q, axis=1)
+    return out
+
+
+# correct p along axis (default: the last, i.e. per contrast)
+# pooled=True corrects every p-value in the array as one family
+#  (global FDR across all contrasts)
+def adjust(p, method='bh', axis=-1, pooled=False, lam=0.5):
+    if method not in METHODS:
+        raise ValueError('unknown method {!r}, use one of {}'.format(
+            method, ', '.join(METHODS)))
+    p = np.asarray(p, dtype=float)
+    if pooled:
+        return _adjust_rows(p.reshape(1, -1), method, lam).reshape(p.shape)
+
+    moved = np.moveaxis(p, axis, -1)
+    rows = moved.reshape(-1, moved.shape[-1])
+    q = _adjust_rows(rows, method, lam).reshape(moved.shape)
+    return np.moveaxis(q, -1, axis)
@@ -0,0 +1,94 @@
+import csv
+import numpy as np
+import loader
+
+# metadata strings that mean "no value" (as in the R input checks)
+META_NA_STRINGS = ['', ' ', 'NA', 'NaN', 'na', 'nan', 'NAN', 'Nan']
+
+# the default grouping used by all the scripts
+DEFAULT_BY = ('Site', 'Timepoint')
+
+
+# read the metadata csv into {column title: array of values}
+def read_metadata(meta_path):
+    with open(meta_path, newline='') as f:
+        rows = list(csv.reader(f))
+    titles = rows[0]
+    body = np.array(rows[1:], dtype=str).reshape(-1, len(titles))
+    return {t: body[:, i] for i, t in enumerate(titles)}
+
+
+# maps metadata factors (Site, Timepoint, PatientID, ...) onto the
+#  sample columns of the working data
+# every grouping asked for is worked out once as integer column arrays
+#  and kept, so the scripts never need hard-coded slices
+class GroupIndex:
+
+    def __init__(self, meta, header, col_name='Columns',
+                 n_annot=loader.N_ANNOT):
+        samples = list(header[n_annot:])
+        position = {s: i for i, s in enumerate(samples)}
+
+        # keep metadata rows that name a column present in the data,
+        #  in metadata order
+        names = meta[col_name]
+        keep = np.array([n not in META_NA_STRINGS and n in position
+                         for n in names], dtype=bool)
+        self.samples = samples
+        self.cols = np.array([position[n] for n in names[keep]], dtype=int)
+        self.factors = {k: v[keep] for k, v in meta.items()}
+        self._groups = {}
+
+    @classmethod
+    def from_files(cls, meta_path, header, col_name='Columns',
+                   n_annot=loader.N_ANNOT):
+        return cls(read_metadata(meta_path), header, col_name, n_annot)
+
+    # {(level, level, ...): data column indices}, groups in order of
+    #  first appearance in the metadata
+    def groups(self, by=DEFAULT_BY):
+        by = tuple(by)
+        if by not in self._groups:
+            keys = list(zip(*[self.factors[f] for f in by]))
+            out = {}
+            for key, col in zip(keys, self.cols):
+                out.setdefault(key, []).append(col)
+            self._groups[by] = {k: np.array(v, dtype=int)
+                                for k, v in out.items()}
+        return self._groups[by]
+
+    def keys(self, by=DEFAULT_BY):
+        return list(self.groups(by))
+
+    # plot labels, e.g. ('BMIF', 'Dx') -> 'BMIF, Dx'
+    def labels(self, by=DEFAULT_BY):
+        return [', '.join(k) for k in self.groups(by)]
+
+    # file name labels, e.g. ('BMIF', 'Dx') -> 'bmif_dx'
+    def file_labels(self, by=DEFAULT_BY):
+        return ['_'.join(k).lower() for k in self.groups(by)]
+
+    # metadata value of a factor (e.g. PatientID) for each data column
+    def values(self, name, cols):
+        lookup = dict(zip(self.cols, self.factors[name]))
+        return np.array([lookup[c] for c in cols])
+
+    # all the group columns back to back, and where each group starts/ends
+    def order(self, by=DEFAULT_BY):
+        groups = self.groups(by)
+        order = np.concatenate(list(groups.values()))
+        bounds = np.cumsum([0] + [len(v) for v in groups.values()])
+        return order, bounds
+
+    # copy of a single group's columns, contiguous in memory
+    def take(self, wd, key, by=DEFAULT_BY):
+        return np.ascontiguousarray(wd[:, self.groups(by)[key]])
+
+    # gather the data once with each group's columns next to each other
+    #  and return {key: view} into that block
+    # (for a memmap only the group columns are read)
+    def reordered(self, wd, by=DEFAULT_BY):
+        order, bounds = self.order(by)
+        block = np.ascontiguousarray(wd[:, order])
+        return {k: block[:, s:e] for k, s, e
+                in zip(self.groups(by), bounds[:-1], bounds[1:])}
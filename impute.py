@@ -0,0 +1,133 @@
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import presence
+
+# missing value imputation for proteins x samples matrices of log
+#  intensities (impute before normalizing, on log2 of the raw data)
+#
+# left-censored, for values missing because they were below detection:
+#  'downshift' - draws from a normal shifted down from each sample's own
+#                distribution (Perseus): mean - shift*sd, width*sd
+#  'minprob'   - draws from a normal around each sample's q-quantile
+#                with the median protein sd (MinProb in imputeLCMD)
+# 'knn' - mean of the k nearest proteins that were measured in the
+#  sample, by nan-euclidean distance over the samples both have (scaled
+#  up to all samples, as sklearn's KNNImputer)
+#
+# knn works on blocks of block_rows proteins: the distances from a block
+#  to every protein come from three matrix products (so only block x
+#  proteins distances are ever held), and only the candidates nearest
+#  proteins of each are kept; blocks are independent and run in a thread
+#  pool (the products and sorts release the GIL, and the threads share
+#  the matrix instead of copying it to processes)
+#
+# every function returns a new matrix; where it was nan in x and isn't
+#  now, a value was imputed (see imputed_bits)
+
+METHODS = ('downshift', 'minprob', 'knn')
+
+
+def _column_stats(x):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # empty samples
+        return np.nanmean(x, axis=0), np.nanstd(x, axis=0, ddof=1)
+
+
+# fill the nans of x with normal draws, mean mu and sd sd per sample
+def _draw(x, mu, sd, seed):
+    rng = np.random.default_rng(seed)
+    out = np.array(x, dtype=float)
+    miss = np.isnan(out)
+    cols = np.nonzero(miss)[1]
+    out[miss] = rng.normal(mu[cols], sd[cols])
+    return out
+
+
+def downshift(x, shift=1.8, width=0.3, seed=0):
+    mu, sd = _column_stats(x)
+    return _draw(x, mu - shift*sd, width*sd, seed)
+
+
+def minprob(x, q=0.01, tune=1.0, seed=0):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mu = np.nanquantile(x, q, axis=0)
+        # sd of the proteins measured in at least half of the samples
+        n = (~np.isnan(x)).sum(axis=1)
+        sd = np.nanmedian(np.nanstd(x[n >= x.shape[1] / 2], axis=1, ddof=1))
+    return _draw(x, mu, np.full(x.shape[1], sd*tune), seed)
+
+
+# imputed values for the rows of one block
+def _knn_block(rows, x, x0, x2, m, k, candidates):
+    n_samples = x.shape[1]
+    # squared distances over the samples both proteins have
+    d2 = x2[rows] @ m.T + m[rows] @ x2.T - 2 * (x0[rows] @ x0.T)
+    shared = m[rows] @ m.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d2 = np.maximum(d2, 0) * (n_samples / shared)
+    d2[shared == 0] = np.inf
+    d2[np.arange(len(rows)), rows] = np.inf
+
+    # nearest candidates, closest first
+    c = min(candidates, d2.shape[1])
+    near = np.argpartition(d2, c - 1, axis=1)[:, :c]
+    dist = np.take_along_axis(d2, near, axis=1)
+    order = np.argsort(dist, axis=1, kind='stable')
+    near = np.take_along_axis(near, order, axis=1)
+    dist = np.take_along_axis(dist, order, axis=1)
+
+    # for every sample the first k candidates measured in it
+    values = x[near]                                   # rows x c x samples
+    usable = ~np.isnan(values) & np.isfinite(dist)[:, :, None]
+    usable &= np.cumsum(usable, axis=1) <= k
+    n = usable.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(usable, values, 0).sum(axis=1) / n
+    block = x[rows]
+    return np.where(np.isnan(block), means, block)
+
+
+# k: neighbours averaged; candidates: nearest proteins kept per protein
+#  (default 4*k), of which the first k measured in a sample are used
+# values with no measured neighbour are left to fallback ('downshift' or
+#  'minprob', None to leave them missing)
+def knn(x, k=10, block_rows=256, candidates=None, threads=None,
+        fallback='downshift', seed=0):
+    x = np.asarray(x, dtype=float)
+    if candidates is None:
+        candidates = 4*k
+    m = (~np.isnan(x)).astype(float)
+    x0 = np.nan_to_num(x)
+    x2 = x0*x0
+    out = x.copy()
+
+    todo = np.flatnonzero(m.sum(axis=1) < x.shape[1])
+    blocks = [todo[s:s + block_rows] for s in range(0, len(todo), block_rows)]
+    with ThreadPoolExecutor(threads) as pool:
+        filled = pool.map(lambda rows: _knn_block(rows, x, x0, x2, m, k,
+                                                  candidates), blocks)
+        for rows, block in zip(blocks, filled):
+            out[rows] = block
+
+    if fallback is not None and np.isnan(out).any():
+        out = impute(out, fallback, seed=seed)
+    return out
+
+
+def impute(x, method='knn', **kwargs):
+    if method == 'downshift':
+        return downshift(x, **kwargs)
+    if method == 'minprob':
+        return minprob(x, **kwargs)
+    if method == 'knn':
+        return knn(x, **kwargs)
+    raise ValueError('unknown imputation {!r}, expected one of {}'.format(
+        method, ', '.join(METHODS)))
+
+
+# packed (as presence.pack) samples x proteins/8 bits of the values that
+#  were imputed: present after, missing before
+def imputed_bits(before, after):
+    return presence.pack(after) & ~presence.pack(before)
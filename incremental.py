@@ -0,0 +1,207 @@
+import os
+import pickle
+import numpy as np
+import loader
+import store
+import groups
+import qc
+import normalize
+import contrasts
+import fdr
+import annotations
+import validate
+import pipeline
+
+# incremental re-analysis for data files that grow by sample columns
+# (runs are added to the csv one at a time, at the end)
+#
+# what was worked out for the samples already seen is kept in the store
+#  (<data>.store/incremental_<dtype>.pkl): the samples, their groups, the
+#  per-group n / sum / sum of squares (contrasts.GroupStats), the
+#  contrast results and where the figures went
+# when the csv has gained columns:
+#  - the store converts only the new columns (store.append_columns), and
+#    the presence bits and QC table get rows for them only
+#  - the new samples are median (or mean) centered on their own, and
+#    added to their groups' sums
+#  - only the contrasts of groups that got samples (or are new) are
+#    tested again, and FDR corrected again (every contrast is corrected
+#    on its own)
+#  - only the figures showing those groups or contrasts are drawn again
+#    (protein counts and upset show every group, so they always are)
+# anything else (a csv changed in other ways, samples moved between
+#  groups, different settings) falls back to a full run, which also
+#  starts the saved state
+# the input checks of pipeline.run (validate.py) come first; if they
+#  leave out proteins (repeated or empty) or empty samples, the data
+#  analysed isn't the store any more and it is a pipeline.run instead
+#
+# only per-sample normalization and the unpaired t-tests can be updated
+#  this way; the paired model, quantile normalization and imputation
+#  need all samples at once (use pipeline.run for those)
+
+# settings the saved statistics depend on, and the ones the figures do
+STATS_SETTINGS = ('dtype', 'by', 'min_obs', 'equal_var', 'fdr',
+                  'normalization')
+PLOT_SETTINGS = ('min_lfc', 'min_lp', 'threshold', 'fmt', 'out_dir',
+                 'table')
+RESULT_KEYS = ('mean_a', 'mean_b', 'log2fc', 't', 'df', 'p', 'q')
+
+
+def state_path(csv_path, dtype=np.float64):
+    return os.path.join(store.store_path(csv_path),
+                        'incremental_{}.pkl'.format(np.dtype(dtype).name))
+
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save_state(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(state, f)
+    os.replace(tmp, path)
+
+
+# the columns' values minus their centers
+def _centered(wd, cols, summary, method):
+    block = np.asarray(store.read_columns(wd, cols), dtype=np.float64)
+    if method == 'median':
+        return block - summary['raw_median'][cols]
+    return normalize.center(block, method)
+
+
+# bring the analysis of csv_path up to date
+# params as pipeline.run (see pipeline.DEFAULTS)
+# returns {'full', 'new', 'groups', 'contrasts', 'figures', 'paths'}: if
+#  it was a full run, the new sample names, the groups and contrasts
+#  that were updated, the figures drawn and where they went
+def update(csv_path, meta_path, verbose=True, **params):
+    p = dict(pipeline.DEFAULTS)
+    p.update(params)
+    p['csv'] = csv_path
+    p['meta'] = meta_path
+    if p['analysis'] != 'ttest' or p['imputation'] is not None or \
+            p['normalization'] not in ('median', 'mean'):
+        raise ValueError('incremental updates need the unpaired t-tests, '
+                         'median or mean normalization and no imputation; '
+                         'use pipeline.run')
+    validate.check_file(csv_path, 'Data')
+    validate.check_file(meta_path, 'Metadata')
+    dtype = np.dtype(p['dtype'])
+    by = p['by']
+    method = p['normalization']
+
+    # the store first: appended columns only convert the new ones
+    appended = store.append_columns(csv_path, dtype)
+    wd, annot, header = loader.load_matrix(csv_path, mmap=True, dtype=dtype)
+    if appended is not None and len(appended):
+        summary = qc.extend_summary(csv_path, appended, dtype)
+    else:
+        summary = qc.load_summary(csv_path, dtype)
+    gi = groups.GroupIndex.from_files(meta_path, header)
+    key_of = {int(c): k for k, cols in gi.groups(by).items() for c in cols}
+    samples = list(header[loader.N_ANNOT:])
+    pairs = contrasts.one_factor_contrasts(gi.keys(by))
+
+    spath = state_path(csv_path, dtype)
+    checked = pipeline.run(csv_path, meta_path, until='validate',
+                           verbose=verbose, **params)['validate']
+    if len(checked['rows']) != wd.shape[0] or \
+            set(checked['cols'].tolist()) != set(key_of):
+        if os.path.exists(spath):
+            os.remove(spath)
+        result = pipeline.run(csv_path, meta_path, verbose=verbose, **params)
+        return {'full': True, 'new': [samples[c] for c in sorted(key_of)],
+                'groups': gi.keys(by), 'contrasts': pairs,
+                'figures': [os.path.splitext(os.path.basename(r['path']))[0]
+                            for r in result['plot']['renders']],
+                'paths': result['plot']['paths']}
+    state = _load_state(spath)
+    stats_settings = {k: p[k] for k in STATS_SETTINGS}
+    plot_settings = {k: p[k] for k in PLOT_SETTINGS}
+    full = appended is None or state is None or \
+        state['settings'] != stats_settings or \
+        samples[:len(state['samples'])] != state['samples'] or \
+        any(key_of.get(c) != state['keys'].get(c)
+            for c in range(len(state['samples'])))
+
+    results = {k: np.full((len(pairs), wd.shape[0]), np.nan)
+               for k in RESULT_KEYS}
+    if full:
+        new = sorted(key_of)
+        changed = gi.keys(by)
+        gstats = contrasts.GroupStats.from_blocks(
+            {k: _centered(wd, cols, summary, method)
+             for k, cols in gi.groups(by).items()})
+        todo = list(range(len(pairs)))
+    else:
+        new = [c for c in range(len(state['samples']), len(samples))
+               if c in key_of]
+        gstats = state['gstats']
+        changed = list(dict.fromkeys(key_of[c] for c in new))
+        for key in changed:
+            cols = np.array([c for c in new if key_of[c] == key])
+            gstats.add(key, _centered(wd, cols, summary, method))
+        old = {pair: i for i, pair in enumerate(state['results']['pairs'])}
+        todo = []
+        for i, pair in enumerate(pairs):
+            if pair[0] in changed or pair[1] in changed or pair not in old:
+                todo.append(i)
+            else:
+                for k in RESULT_KEYS:
+                    results[k][i] = state['results'][k][old[pair]]
+
+    if todo:
+        tested = contrasts.run_contrasts(gstats, [pairs[i] for i in todo],
+                                         equal_var=p['equal_var'],
+                                         min_obs=p['min_obs'])
+        tested['q'] = fdr.adjust(tested['p'], method=p['fdr'])
+        for k in RESULT_KEYS:
+            results[k][todo] = tested[k]
+    results['pairs'] = pairs
+    table = pipeline.results_table(results,
+                                   annotations.AnnotationTable(annot), p)
+
+    # the figures to draw: all of them for a full run or new figure
+    #  settings, otherwise the ones new samples show up in, plus any
+    #  whose file has gone
+    if full or state['plot_settings'] != plot_settings:
+        names = None
+    else:
+        labels = dict(zip(gi.keys(by), gi.file_labels(by)))
+        names = set()
+        if new:
+            names.update(['protein_counts', 'upset'])
+            names.update('cloud_{}'.format(labels[k]) for k in changed)
+        if todo:
+            names.add('volcano')
+        names.update(n for n, path in state['paths'].items()
+                     if not os.path.exists(path))
+    jobs = pipeline.figure_jobs(wd, gi, summary, table, p, names)
+    paths = dict(state['paths']) if not full and names is not None else {}
+    rendered = {}
+    if jobs:
+        rendered = pipeline.render_figures(
+            jobs, table if 'volcano' in jobs else None, p)
+        paths.update({name: job[1] for name, job in jobs.items()})
+
+    _save_state(spath, {'samples': samples, 'keys': key_of,
+                        'settings': stats_settings,
+                        'plot_settings': plot_settings, 'gstats': gstats,
+                        'results': results, 'paths': paths})
+    out = {'full': full, 'new': [samples[c] for c in new],
+           'groups': changed, 'contrasts': [pairs[i] for i in todo],
+           'figures': list(jobs), 'paths': rendered.get('paths', [])}
+    if verbose:
+        print('{} run: {} new sample(s), {} group(s), {} contrast(s), '
+              '{} figure(s) updated'.format(
+                  'full' if full else 'incremental', len(out['new']),
+                  len(changed), len(todo), len(jobs)))
+        for r in rendered.get('renders', []):
+            print('  {}: {:.2f} s'.format(r['path'], r['seconds']))
+    return out
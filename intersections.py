@@ -0,0 +1,123 @@
+import csv
+import numpy as np
+
+# UpSet-style intersections for any number of sets
+# each protein's membership is one integer, bit i set if the protein is
+#  in set i; the size of every exclusive intersection (proteins in exactly
+#  those sets and no others) is then a count of the distinct masks
+# up to 62 sets fit in an int64 mask; only the masks that occur are
+#  counted (never a 2^n_sets table), so counts come as two arrays: the
+#  masks, sorted, and the number of proteins with each
+
+
+# membership: proteins x sets, bool
+def encode(membership):
+    membership = np.asarray(membership, dtype=bool)
+    weights = np.left_shift(np.int64(1), np.arange(membership.shape[1],
+                                                   dtype=np.int64))
+    return membership.astype(np.int64) @ weights
+
+
+# the set indices in a mask, e.g. 0b1011 -> (0, 1, 3)
+def decode(mask, n_sets):
+    return tuple(i for i in range(n_sets) if (int(mask) >> i) & 1)
+
+
+# number of sets in each mask
+def degree(masks):
+    masks = np.asarray(masks, dtype=np.int64)
+    out = np.zeros(masks.shape, dtype=int)
+    while np.any(masks):
+        out += (masks & 1).astype(int)
+        masks = masks >> 1
+    return out
+
+
+# size of every non-empty exclusive intersection: the masks that occur
+#  and their counts
+def exclusive_counts(masks):
+    return np.unique(np.asarray(masks, dtype=np.int64), return_counts=True)
+
+
+# the non-empty exclusive intersections, largest degree first (then in
+#  set order), or largest first with order='size'
+# min_size drops small intersections, top_k keeps the k largest
+# returns the masks and their sizes
+def intersections(masks, n_sets, min_size=1, top_k=None, order='degree'):
+    return select(*exclusive_counts(masks), n_sets, min_size, top_k, order)
+
+
+# as intersections(), from masks and their counts (e.g. one row of a
+#  sweep)
+def select(masks, counts, n_sets, min_size=1, top_k=None, order='degree'):
+    masks = np.asarray(masks, dtype=np.int64)
+    counts = np.asarray(counts)
+    keep = (counts >= max(min_size, 1)) & (masks != 0)  # 0: in no set
+    found = masks[keep]
+    sizes = counts[keep]
+
+    if top_k is not None and len(found) > top_k:
+        keep = np.sort(np.argsort(-sizes, kind='stable')[:top_k])
+        found = found[keep]
+        sizes = sizes[keep]
+
+    if order == 'size':
+        idx = np.argsort(-sizes, kind='stable')
+    else:
+        # same set order as reading the combinations left to right
+        sets = [decode(m, n_sets) for m in found]
+        idx = sorted(range(len(found)),
+                     key=lambda i: (-len(sets[i]), sets[i]))
+        idx = np.array(idx, dtype=int)
+    return found[idx], sizes[idx]
+
+
+# protein (row) indices in each of the given masks, from one sort
+def members(masks, wanted):
+    order = np.argsort(masks, kind='stable')
+    sorted_masks = masks[order]
+    start = np.searchsorted(sorted_masks, wanted, side='left')
+    end = np.searchsorted(sorted_masks, wanted, side='right')
+    return {int(m): order[s:e] for m, s, e in zip(wanted, start, end)}
+
+
+# size of each set from masks and their counts
+def set_sizes(masks, counts, n_sets):
+    masks = np.asarray(masks, dtype=np.int64)
+    return np.array([counts[((masks >> i) & 1) == 1].sum()
+                     for i in range(n_sets)])
+
+
+# intersection sizes for every presence threshold
+# counts: proteins x sets, number of samples each protein was seen in
+#  for each set (group); a protein is in a set at threshold t if it was
+#  seen in at least t of the set's samples
+# returns the thresholds, the masks that occur at any of them (sorted)
+#  and a thresholds x masks table of exclusive intersection sizes, so
+#  the table only has a column for every intersection that is there
+def threshold_sweep(counts, thresholds=None):
+    counts = np.asarray(counts)
+    if thresholds is None:
+        thresholds = np.arange(1, counts.max(initial=0) + 1)
+    thresholds = np.asarray(thresholds)
+    found = [exclusive_counts(encode(counts >= t)) for t in thresholds]
+    masks = np.unique(np.concatenate([m for m, _ in found] +
+                                     [np.empty(0, dtype=np.int64)]))
+    table = np.zeros((len(thresholds), len(masks)), dtype=np.int64)
+    for row, (m, c) in zip(table, found):
+        row[np.searchsorted(masks, m)] = c
+    return thresholds, masks, table
+
+
+# write a sweep table as csv: one row per threshold, one column per
+#  intersection that is non-empty at any threshold ('a & b' labels)
+def save_sweep(path, thresholds, masks, table, labels):
+    n_sets = len(labels)
+    cols = np.flatnonzero(table.any(axis=0) & (masks != 0))
+    names = [' & '.join(labels[i] for i in decode(masks[c], n_sets))
+             for c in cols]
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['threshold'] + names)
+        for t, row in zip(thresholds, table[:, cols]):
+            writer.writerow([t] + row.tolist())
@@ -0,0 +1,167 @@
+import numpy as np
+import scipy.special as sci_sp
+import scipy.stats as sci_ss
+import groups
+
+# per-protein linear models, fitted for all proteins at once
+#
+# the design has one column per Site x Timepoint group (cell means) plus
+#  treatment-coded PatientID columns, so Dx/D29 and BMIF/PB contrasts are
+#  taken within patient (paired)
+# every missing-value pattern gets its own X'WX (W the pattern's 0/1
+#  weights) from one product of the patterns with every sample's x x',
+#  and all of them are inverted in one stacked pinv; the coefficients of
+#  every protein then come from one product with the zero-filled data,
+#  so there is no loop over proteins or patterns (memory is patterns x
+#  coefficients^2)
+# moderated t statistics follow limma's empirical Bayes approach: the
+#  protein variances are shrunk towards a common prior fitted to all of
+#  them (Smyth 2004, doi:10.2202/1544-6115.1027)
+
+
+# design matrix for the samples in gi (metadata order)
+# returns the data columns, the design (samples x coefficients) and the
+#  coefficient names (group keys first, then 'PatientID=<level>')
+def design_matrix(gi, by=groups.DEFAULT_BY, block='PatientID'):
+    keys = gi.keys(by)
+    cols = np.concatenate(list(gi.groups(by).values()))
+    key_of = {}
+    for k, c in gi.groups(by).items():
+        for col in c:
+            key_of[col] = k
+
+    X = np.array([[1.0 if key_of[c] == k else 0.0 for k in keys]
+                  for c in cols])
+    names = list(keys)
+    if block is not None:
+        b = gi.values(block, cols)
+        levels = list(dict.fromkeys(b))
+        B = np.array([[1.0 if v == lv else 0.0 for lv in levels[1:]]
+                      for v in b]).reshape(len(cols), -1)
+        X = np.hstack([X, B])
+        names += ['{}={}'.format(block, lv) for lv in levels[1:]]
+    return cols, X, names
+
+
+# least-squares fit of every row of Y (proteins x samples) on X
+# returns {'beta', 'sigma2', 'df', 'pattern'} per protein, plus the
+#  unscaled covariance and the projector used to check estimability for
+#  each missing-value pattern ('cov', 'proj')
+def fit(Y, X, tol=1e-8):
+    Y = np.asarray(Y, dtype=float)
+    present = ~np.isnan(Y)
+    patterns, pattern = np.unique(present, axis=0, return_inverse=True)
+    pattern = pattern.ravel()
+
+    # X'WX for every pattern, its pseudo-inverse, and the projector onto
+    #  its row space (whose trace is the rank of the pattern's design)
+    n_coef = X.shape[1]
+    xtwx = (patterns.astype(float) @ (X[:, :, None] * X[:, None, :])
+            .reshape(len(X), -1)).reshape(-1, n_coef, n_coef)
+    cov = np.linalg.pinv(xtwx, rcond=tol)
+    proj = xtwx @ cov
+    rank = np.rint(np.trace(proj, axis1=1, axis2=2)).astype(int)
+
+    # X'Wy for every protein is X' times y with the missing values at 0
+    Y0 = np.where(present, Y, 0.0)
+    beta = np.einsum('pij,pj->pi', cov[pattern], Y0 @ X)
+    resid = np.where(present, Y0 - beta @ X.T, 0.0)
+    df = (present.sum(axis=1) - rank[pattern]).astype(float)
+    fitted = rank[pattern] > 0
+    beta[~fitted] = np.nan
+    df[~fitted] = 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma2 = (resid*resid).sum(axis=1) / df
+    sigma2[~fitted | (df < 1)] = np.nan
+    return {'beta': beta, 'sigma2': sigma2, 'df': df, 'pattern': pattern,
+            'cov': cov, 'proj': proj}
+
+
+# inverse of the trigamma function (Newton's method, as in limma)
+def trigamma_inverse(x):
+    x = np.asarray(x, dtype=float)
+    y = 0.5 + 1.0/x
+    for _ in range(50):
+        tri = sci_sp.polygamma(1, y)
+        dif = tri*(1 - tri/x) / sci_sp.polygamma(2, y)
+        y = y + dif
+        if np.max(-dif/y) < 1e-8:
+            break
+    return y
+
+
+# prior degrees of freedom (d0) and variance (s0^2) for the protein
+#  variances, by moments of log(s^2) (limma's fitFDist without covariate)
+def fit_prior(sigma2, df):
+    ok = np.isfinite(sigma2) & (sigma2 > 0) & (df > 0)
+    s2 = sigma2[ok]
+    d = df[ok]
+    if len(s2) < 2:
+        return np.inf, np.nan
+    z = np.log(s2) - sci_sp.digamma(d/2) + np.log(d/2)
+    e = z.mean()
+    var = z.var(ddof=1) - np.mean(sci_sp.polygamma(1, d/2))
+    if var <= 0:
+        return np.inf, np.exp(e)
+    d0 = 2*trigamma_inverse(var)
+    s0 = np.exp(e + sci_sp.digamma(d0/2) - np.log(d0/2))
+    return float(d0), float(s0)
+
+
+# estimate, t, df and p for one contrast vector c over the coefficients
+# moderated=True shrinks each protein's variance towards the prior
+def test_contrast(model, c, moderated=True, prior=None, tol=1e-8):
+    c = np.asarray(c, dtype=float)
+    est = model['beta'] @ c
+    unscaled = np.einsum('i,kij,j->k', c, model['cov'], c)[model['pattern']]
+    # the contrast can only be estimated if it lies in the row space of
+    #  the design that was left after dropping missing samples
+    estimable = np.all(np.abs(model['proj'] @ c - c) < 1e-6,
+                       axis=1)[model['pattern']]
+
+    s2 = model['sigma2']
+    df = model['df'].astype(float)
+    if moderated:
+        d0, s0 = prior if prior is not None else \
+            fit_prior(model['sigma2'], model['df'])
+        # proteins without residual df get the prior variance, as in limma
+        # the total df is capped at the pooled residual df
+        if np.isinf(d0):
+            s2 = np.full(len(est), s0)
+            df = np.full(len(est), np.sum(df))
+        else:
+            s2 = (d0*s0 + df*np.nan_to_num(s2)) / (d0 + df)
+            df = np.minimum(df + d0, np.sum(df))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = est / np.sqrt(s2 * unscaled)
+    bad = ~estimable | (unscaled < tol) | (df <= 0)
+    est[bad] = np.nan
+    t[bad] = np.nan
+    p = 2 * sci_ss.t.sf(np.abs(t), df)
+    return est, t, df, p
+
+
+# group contrasts (pairs of group keys) through the linear model
+# wd should already be log-transformed and normalized; the estimate is
+#  then the log fold change
+# returns {name: contrasts x proteins array}, like contrasts.run_contrasts
+def lm_contrasts(wd, gi, pairs, by=groups.DEFAULT_BY, block='PatientID',
+                 moderated=True):
+    cols, X, names = design_matrix(gi, by, block)
+    model = fit(wd[:, cols], X)
+    prior = fit_prior(model['sigma2'], model['df']) if moderated else None
+
+    out = {k: np.empty((len(pairs), wd.shape[0]))
+           for k in ('log2fc', 't', 'df', 'p')}
+    for i, (a, b) in enumerate(pairs):
+        c = np.zeros(len(names))
+        c[names.index(a)] = 1.0
+        c[names.index(b)] = -1.0
+        est, t, df, p = test_contrast(model, c, moderated, prior)
+        out['log2fc'][i] = est
+        out['t'][i] = t
+        out['df'][i] = df
+        out['p'][i] = p
+    out['prior'] = prior
+    return out
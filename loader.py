@@ -0,0 +1,124 @@
+import os
+import csv
+import hashlib
+import numpy as np
+
+# strings that mean a protein was not measured in a sample
+# (same list as the R input checks, including 'Filtered')
+NA_STRINGS = ['', ' ', 'NA', 'NaN', 'na', 'nan', 'NAN', 'Nan', 'Filtered']
+
+# the first two columns are PG.ProteinGroups and PG.Genes,
+# everything after that is one column per sample
+N_ANNOT = 2
+
+
+# the binary cache lives next to the csv, same name with .npz
+def cache_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.npz'
+
+
+# sha1 of the file contents, read in 1 MB blocks
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+# numbers from strings; NA strings and anything else that isn't a
+#  number (e.g. '#N/A', 'n.d.') become nan, as as.numeric in R
+# the NA strings are swapped for nan and the whole block converted in
+#  one go; only if that fails is every distinct string tried on its own
+def to_numeric(cells, dtype=np.float64):
+    cells = np.array(cells, dtype=str)
+    cells[np.isin(cells, NA_STRINGS)] = 'nan'
+    try:
+        return cells.astype(dtype)
+    except ValueError:
+        uniq, inverse = np.unique(cells, return_inverse=True)
+        values = np.full(len(uniq), np.nan, dtype=dtype)
+        for i, v in enumerate(uniq):
+            try:
+                values[i] = float(v)
+            except ValueError:
+                pass
+        return values[inverse].reshape(cells.shape)
+
+
+# convert a block of csv rows (lists of strings) in one go
+def parse_rows(rows, n_cols, n_annot=N_ANNOT, dtype=float):
+    body = np.array(rows, dtype=str).reshape(-1, n_cols)
+    return to_numeric(body[:, n_annot:], dtype), body[:, :n_annot]
+
+
+# read the csv once: header, annotation columns and the numeric matrix
+def parse_csv(csv_path, n_annot=N_ANNOT):
+    with open(csv_path, newline='') as f:
+        rows = list(csv.reader(f))
+    header = np.array(rows[0], dtype=str)
+    wd, annot = parse_rows(rows[1:], len(header), n_annot)
+    return wd, annot, header
+
+
+# check the cache against the csv
+# size + mtime match -> valid without reading the csv
+# size matches but mtime doesn't (copied/touched file) -> compare hashes
+def cache_valid(cached, st, csv_path):
+    if int(cached['size']) != st.st_size:
+        return False
+    if int(cached['mtime']) == st.st_mtime_ns:
+        return True
+    return str(cached['sha1']) == file_hash(csv_path)
+
+
+def write_cache(cpath, wd, annot, header, n_annot, st, sha1):
+    # write to a temp file first so a half-written cache is never read
+    tmp = cpath + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, wd=wd, annot=annot, header=header, n_annot=n_annot,
+                 size=st.st_size, mtime=st.st_mtime_ns, sha1=sha1)
+    os.replace(tmp, cpath)
+
+
+# main entry point for the scripts
+# returns the working data (proteins x samples) as dtype, the annotation
+#  columns (PG.ProteinGroups, PG.Genes) and the header
+# the first call parses the text, later calls read the .npz cache; a
+#  cache found valid by its hash (the csv was touched or copied) is
+#  written again with the new mtime, so the csv is hashed only once
+# mmap=True opens the on-disk store instead (see store.py), the
+#  matrix is then a read-only memmap and is never fully in memory
+def load_matrix(csv_path, n_annot=N_ANNOT, use_cache=True,
+                mmap=False, dtype=np.float32):
+    if mmap:
+        import store
+        return store.load_store(csv_path, dtype=dtype, n_annot=n_annot)
+
+    st = os.stat(csv_path)
+    cpath = cache_path(csv_path)
+
+    if use_cache and os.path.exists(cpath):
+        found = None
+        with np.load(cpath) as cached:
+            if int(cached['n_annot']) == n_annot and \
+                    cache_valid(cached, st, csv_path):
+                found = cached['wd'], cached['annot'], cached['header']
+                touched = int(cached['mtime']) != st.st_mtime_ns
+                sha1 = str(cached['sha1'])
+        if found is not None:
+            if touched:
+                write_cache(cpath, *found, n_annot, st, sha1)
+            return found[0].astype(dtype, copy=False), found[1], found[2]
+
+    wd, annot, header = parse_csv(csv_path, n_annot)
+    if use_cache:
+        write_cache(cpath, wd, annot, header, n_annot, st,
+                    file_hash(csv_path))
+    return wd.astype(dtype, copy=False), annot, header
+
+
+# protein names for plotting: the first accession of each protein group
+# e.g. 'P01834;A0A0A0MS08' -> 'P01834'
+def first_names(annot):
+    return np.char.partition(annot[:, 0], ';')[:, 0]
@@ -0,0 +1,298 @@
+import warnings
+import numpy as np
+import scipy.stats as sci_ss
+
+# column-wise (per-sample) normalization of proteins x samples matrices
+# transforms:
+#  'log2' - log2 intensity, values <= 0 become nan
+#  'glog' - generalized log2, log2((x + sqrt(x^2 + lam^2))/2): log2 for
+#           large x, close to linear near 0, so the variance of low
+#           intensities isn't blown up (variance stabilizing)
+# methods:
+#  'median', 'mean' - subtract each sample's median / mean
+#  'quantile'       - give every sample the same distribution (the mean
+#                     of the samples' quantile functions)
+# everything skips missing values; a sample's quantiles are taken over
+#  the values present in it, so samples with different numbers of
+#  missing values are mapped by rank fraction, not by rank
+#
+# with chunk_rows the matrix (e.g. the memory-mapped store) is read
+#  chunk_rows proteins at a time and never sorted: medians and quantiles
+#  come from per-sample sketches (QuantileSketch below) filled chunk by
+#  chunk, and the output can be a memmap as well
+# the sketches hold the untransformed intensities, where their relative
+#  accuracy means something; both transforms are increasing, so the
+#  quantiles of the transformed data are the transformed quantiles
+
+TRANSFORMS = (None, 'log2', 'glog')
+METHODS = (None, 'median', 'mean', 'quantile')
+
+# relative accuracy of the sketches and the value range they resolve
+#  (beyond it values are counted in the end buckets)
+ALPHA = 0.005
+MIN_VALUE = 1e-6
+MAX_VALUE = 1e12
+
+
+def log2(wd):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.log2(wd)
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+def glog(wd, lam):
+    wd = np.asarray(wd, dtype=float)
+    return np.log2((wd + np.sqrt(wd*wd + lam*lam)) / 2)
+
+
+# mergeable per-sample quantile sketch, as DDSketch: values fall in
+#  buckets whose edges grow by gamma = (1 + alpha)/(1 - alpha), so any
+#  quantile is within alpha (relative) of the true one; negative values
+#  use mirrored buckets and values within MIN_VALUE of 0 one zero bucket
+# all samples share the bucket edges and the counts are samples x
+#  buckets, so a chunk is added with one bincount and two sketches with
+#  the same layout merge by adding their counts
+# within a bucket values are taken as evenly spread, which makes
+#  quantile() and cdf() inverse to each other; probabilities are rank
+#  fractions as in np.quantile, 0 for the smallest value and 1 for the
+#  largest
+class QuantileSketch:
+
+    def __init__(self, n_cols, alpha=ALPHA, min_value=MIN_VALUE,
+                 max_value=MAX_VALUE):
+        self.n_cols = n_cols
+        self.layout = (alpha, min_value, max_value)
+        self.log_gamma = np.log((1 + alpha) / (1 - alpha))
+        self.i_min = int(np.ceil(np.log(min_value) / self.log_gamma))
+        self.i_max = int(np.ceil(np.log(max_value) / self.log_gamma))
+        n = self.i_max - self.i_min + 1
+        self.n_side = n
+        pos = np.exp(np.arange(self.i_min - 1, self.i_max + 1)
+                     * self.log_gamma)
+        self.edges = np.concatenate([-pos[::-1], pos])
+        self.counts = np.zeros((n_cols, 2*n + 1), dtype=np.int64)
+
+    # bucket of every value (no nans)
+    def _buckets(self, x):
+        a = np.abs(x)
+        with np.errstate(divide='ignore'):
+            i = np.ceil(np.log(a) / self.log_gamma)
+        i = np.clip(np.nan_to_num(i, neginf=self.i_min - 1),
+                    self.i_min - 1, self.i_max).astype(np.int64)
+        b = np.where(x > 0, self.n_side + 1 + (i - self.i_min),
+                     self.i_max - i)
+        b[i < self.i_min] = self.n_side
+        return b
+
+    # add a chunk of rows (proteins x n_cols)
+    def add(self, x):
+        x = np.asarray(x, dtype=float)
+        ok = ~np.isnan(x)
+        n_buckets = self.counts.shape[1]
+        b = self._buckets(x[ok]) + np.nonzero(ok)[1] * n_buckets
+        self.counts += np.bincount(
+            b, minlength=self.n_cols*n_buckets).reshape(self.n_cols, -1)
+        return self
+
+    def merge(self, other):
+        if other.layout != self.layout or other.n_cols != self.n_cols:
+            raise ValueError('sketches with different layouts can not be '
+                             'merged')
+        self.counts += other.counts
+        return self
+
+    def count(self):
+        return self.counts.sum(axis=1)
+
+    # quantiles (probabilities in [0, 1]) of every sample
+    # returns len(probs) x n_cols, nan for samples with no values
+    def quantile(self, probs):
+        probs = np.atleast_1d(np.asarray(probs, dtype=float))
+        cum = np.cumsum(self.counts, axis=1)
+        n = cum[:, -1]
+        # the k-th smallest value is taken to sit at mass k + 0.5
+        r = np.clip(probs[:, None] * (n - 1) + 0.5, 1e-9, None)
+        # one searchsorted over all samples: each sample's running counts
+        #  are offset to lie above the previous sample's
+        shift = (np.arange(self.n_cols) * (n.max(initial=0) + 1))
+        k = np.searchsorted((cum + shift[:, None]).ravel(),
+                            (r + shift).ravel(), side='left')
+        k = (k - np.tile(np.arange(self.n_cols) * cum.shape[1],
+                         len(probs))).reshape(r.shape)
+        k = np.minimum(k, cum.shape[1] - 1)
+        cols = np.arange(self.n_cols)
+        before = np.where(k > 0, cum[cols, np.maximum(k - 1, 0)], 0)
+        c = self.counts[cols, k]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.clip((r - before) / c, 0, 1)
+        out = self.edges[k] + frac * (self.edges[k + 1] - self.edges[k])
+        out[:, n == 0] = np.nan
+        return out
+
+    # rank fraction of x in each sample's values (rows x n_cols)
+    def cdf(self, x):
+        x = np.asarray(x, dtype=float)
+        out = np.full(x.shape, np.nan)
+        ok = ~np.isnan(x)
+        cols = np.nonzero(ok)[1]
+        b = self._buckets(x[ok])
+        cum = np.cumsum(self.counts, axis=1)
+        before = np.where(b > 0, cum[cols, np.maximum(b - 1, 0)], 0)
+        lo = self.edges[b]
+        frac = np.clip((x[ok] - lo) / (self.edges[b + 1] - lo), 0, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[ok] = ((before + frac * self.counts[cols, b] - 0.5) /
+                       (cum[cols, -1] - 1))
+        return np.clip(out, 0, 1)
+
+
+def _row_chunks(n_rows, chunk_rows):
+    for s in range(0, n_rows, chunk_rows):
+        yield slice(s, min(s + chunk_rows, n_rows))
+
+
+def _transform(x, transform, lam):
+    x = np.asarray(x, dtype=float)
+    if transform == 'log2':
+        return log2(x)
+    if transform == 'glog':
+        return glog(x, lam)
+    return x
+
+
+# per-sample sketch of the matrix, chunk_rows at a time
+def sketch(wd, chunk_rows=10000, alpha=ALPHA):
+    sk = QuantileSketch(wd.shape[1], alpha)
+    for rows in _row_chunks(wd.shape[0], chunk_rows):
+        sk.add(wd[rows])
+    return sk
+
+
+# each sample's median or mean over its present values
+# with chunk_rows, medians come from a sketch (within alpha) and means
+#  from running sums
+def centers(wd, method='median', chunk_rows=None, transform=None, lam=None,
+            alpha=ALPHA):
+    if method not in ('median', 'mean'):
+        raise ValueError('unknown centering {!r}'.format(method))
+    if chunk_rows is None:
+        x = _transform(wd, transform, lam)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # empty samples
+            if method == 'median':
+                return np.nanmedian(x, axis=0)
+            return np.nanmean(x, axis=0)
+    if method == 'median':
+        return _transform(sketch(wd, chunk_rows, alpha).quantile(0.5)[0],
+                          transform, lam)
+    s = np.zeros(wd.shape[1])
+    n = np.zeros(wd.shape[1])
+    for rows in _row_chunks(wd.shape[0], chunk_rows):
+        x = _transform(wd[rows], transform, lam)
+        ok = ~np.isnan(x)
+        s += np.where(ok, x, 0.0).sum(axis=0)
+        n += ok.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return s / n
+
+
+# subtract each sample's center (median by default); centers can be
+#  passed in when they are already known (e.g. from the QC table, see
+#  qc.py)
+def center(wd, method='median', values=None):
+    if values is None:
+        values = centers(wd, method)
+    return wd - values
+
+
+# lam for the generalized log: the median over samples of their 5th
+#  percentile, i.e. about where the noise floor takes over
+def glog_lambda(wd, chunk_rows=None, alpha=ALPHA):
+    if chunk_rows is None:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            low = np.nanpercentile(wd, 5, axis=0)
+    else:
+        low = sketch(wd, chunk_rows, alpha=alpha).quantile(0.05)[0]
+    return float(np.nanmedian(low))
+
+
+# the target distribution of quantile normalization on a grid of
+#  probabilities: the mean over samples of their quantiles
+def reference(quantiles):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmean(quantiles, axis=1)
+
+
+# every sample mapped onto the reference distribution by rank fraction
+# exact: ranks (ties averaged) over the present values; with all values
+#  present and no ties this is the textbook version (sorted columns
+#  replaced by the mean of the sorted columns)
+def quantile_normalize(wd, n_grid=None):
+    x = np.asarray(wd, dtype=float)
+    n = (~np.isnan(x)).sum(axis=0)
+    if n_grid is None:
+        n_grid = max(int(n.max(initial=0)), 2)
+    grid = np.linspace(0, 1, n_grid)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        ref = reference(np.nanquantile(x, grid, axis=0))
+    ranks = sci_ss.rankdata(x, axis=0, nan_policy='omit')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = np.where(n > 1, (ranks - 1) / (n - 1), 0.5)
+    out = np.interp(p, grid, ref)
+    out[np.isnan(x)] = np.nan
+    return out
+
+
+# normalize a matrix in one go, or chunk_rows proteins at a time (two
+#  reads: one to fill the sketches, one to write the output)
+# chunked, a value's rank fraction comes from its bucket, so it is
+#  within about half a rank of the exact one; a lone value far out in a
+#  sample's tail can move more than the rest
+# transform: see TRANSFORMS, method: see METHODS
+# values: the per-sample centers, if already known
+# lam: for 'glog' (default glog_lambda of the data)
+# out: array (or memmap) to write into, default a new float64 array
+def normalize(wd, transform='log2', method='median', values=None,
+              chunk_rows=None, lam=None, alpha=ALPHA, n_grid=1001,
+              out=None):
+    if transform not in TRANSFORMS:
+        raise ValueError('unknown transform {!r}, expected one of {}'.format(
+            transform, TRANSFORMS))
+    if method not in METHODS:
+        raise ValueError('unknown method {!r}, expected one of {}'.format(
+            method, METHODS))
+    if transform == 'glog' and lam is None:
+        lam = glog_lambda(wd, chunk_rows, alpha)
+
+    if chunk_rows is None:
+        x = _transform(wd, transform, lam)
+        if method == 'quantile':
+            x = quantile_normalize(x)
+        elif method is not None:
+            x = center(x, method, values)
+        if out is None:
+            return x
+        out[:] = x
+        return out
+
+    if out is None:
+        out = np.empty(wd.shape)
+    if method in ('median', 'mean') and values is None:
+        values = centers(wd, method, chunk_rows, transform, lam, alpha)
+    if method == 'quantile':
+        sk = sketch(wd, chunk_rows, alpha)
+        grid = np.linspace(0, 1, n_grid)
+        ref = reference(_transform(sk.quantile(grid), transform, lam))
+    for rows in _row_chunks(wd.shape[0], chunk_rows):
+        x = _transform(wd[rows], transform, lam)
+        if method == 'quantile':
+            p = sk.cdf(wd[rows])
+            x = np.where(np.isnan(x), np.nan, np.interp(p, grid, ref))
+        elif method is not None:
+            x = x - values
+        out[rows] = x
+    return out
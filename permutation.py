@@ -0,0 +1,203 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import groups
+import stats
+
+# permutation / bootstrap p-values and FDR for group contrasts
+#
+# for each contrast the two groups' columns are taken together and the
+#  group labels are reshuffled n_perm times; the same vectorized t
+#  statistic is computed for every protein under every shuffle
+# labels for a batch of shuffles are a 0/1 weight matrix (samples x
+#  shuffles), so the per-group n, sum and sum of squares of all proteins
+#  under all shuffles in the batch are three matrix products
+#
+# shuffles are split into fixed chunks, each with its own seeded random
+#  stream (spawned from one SeedSequence), and the chunks are spread over
+#  a process pool; the chunks and their streams don't depend on the
+#  number of workers, so neither do the results
+
+# shared with the worker processes by _init_worker
+_DATA = {}
+
+
+# everything a worker needs for one contrast
+# values are centred on the row mean (missing -> 0) so the sums keep
+#  their precision; for the bootstrap each group is centred on its own
+#  mean instead, so resampling draws from the null of equal means
+def prepare(wd, cols_a, cols_b, strata=None, method='permutation'):
+    cols = np.concatenate([cols_a, cols_b])
+    x = np.asarray(wd[:, cols], dtype=float)
+    present = ~np.isnan(x)
+    labels = np.r_[np.ones(len(cols_a)), np.zeros(len(cols_b))]
+
+    n, m, v = stats.nan_moments(x)
+    xc = np.where(present, x - np.nan_to_num(m)[:, None], 0.0)
+    data = {'present': present.astype(float), 'xc': xc, 'xc2': xc*xc,
+            'labels': labels, 'method': method}
+
+    if method == 'bootstrap':
+        na = len(cols_a)
+        for part in (slice(0, na), slice(na, None)):
+            gm = np.nan_to_num(stats.nan_moments(x[:, part])[1])
+            xc[:, part] = np.where(present[:, part],
+                                   x[:, part] - gm[:, None], 0.0)
+        data['xc2'] = xc*xc
+
+    # strata: shuffles only swap labels between samples in the same
+    #  stratum (e.g. the same PatientID), keeping the design intact
+    if strata is None:
+        strata = np.zeros(len(cols))
+    data['strata'] = [np.flatnonzero(strata == s) for s in np.unique(strata)]
+    return data
+
+
+# t for every protein under every column of the weight matrices
+# wa / wb: samples x shuffles, how often each sample counts for a / b
+def t_for_weights(data, wa, wb, equal_var=False, min_obs=2):
+    out = []
+    for w in (wa, wb):
+        n = data['present'] @ w
+        s = data['xc'] @ w
+        ss = data['xc2'] @ w
+        with np.errstate(divide='ignore', invalid='ignore'):
+            m = s / n
+            v = np.maximum((ss - s*s/n) / (n - 1), 0.0)
+        out.append((m, v, n))
+    (ma, va, na), (mb, vb, nb) = out
+    t = stats.t_from_stats(ma, va, na, mb, vb, nb, equal_var)[0]
+    t[(na < min_obs) | (nb < min_obs)] = np.nan
+    return t
+
+
+# weight matrices for one chunk of shuffles
+def draw_weights(data, n, rng):
+    labels = data['labels']
+    if data['method'] == 'bootstrap':
+        # resample each group's samples with replacement
+        wa = np.zeros((len(labels), n))
+        wb = np.zeros((len(labels), n))
+        for w, idx in ((wa, np.flatnonzero(labels == 1)),
+                       (wb, np.flatnonzero(labels == 0))):
+            draws = idx[rng.integers(0, len(idx), size=(n, len(idx)))]
+            for j in range(n):
+                w[:, j] = np.bincount(draws[j], minlength=len(labels))
+        return wa, wb
+
+    # shuffle the labels within each stratum, n times at once
+    wa = np.empty((len(labels), n))
+    for idx in data['strata']:
+        order = np.argsort(rng.random((n, len(idx))), axis=1)
+        wa[idx] = labels[idx][order].T
+    return wa, 1.0 - wa
+
+
+def _init_worker(data):
+    _DATA.clear()
+    _DATA.update(data)
+
+
+# one chunk of shuffles for one contrast
+# returns, per protein, how many null |t| reached the protein's own
+#  observed |t| (for its p-value) and how many null |t| over all proteins
+#  reached it (for the FDR)
+def _run_chunk(task):
+    name, n, seed, equal_var, min_obs = task
+    data = _DATA[name]
+    rng = np.random.default_rng(seed)
+    wa, wb = draw_weights(data, n, rng)
+    null = np.abs(t_for_weights(data, wa, wb, equal_var, min_obs))
+    obs = data['obs']
+
+    with np.errstate(invalid='ignore'):
+        exceed = np.sum(null >= obs[:, None], axis=1)
+    pooled = np.sort(null[~np.isnan(null)])
+    tested = ~np.isnan(obs)
+    null_ge = np.zeros(len(obs), dtype=np.int64)
+    null_ge[tested] = len(pooled) - np.searchsorted(pooled, obs[tested], 'left')
+    return name, exceed, null_ge
+
+
+# permutation FDR: expected number of null |t| at or above each observed
+#  |t| over the number of observed |t| at or above it, made monotone
+def _perm_fdr(obs, null_ge, n_perm):
+    q = np.full(len(obs), np.nan)
+    tested = np.flatnonzero(~np.isnan(obs))
+    if len(tested) == 0:
+        return q
+    order = tested[np.argsort(-obs[tested], kind='stable')]
+    # ties: every protein with the same |t| is called together
+    ranks = np.searchsorted(-obs[order], -obs[order], side='right')
+    est = (null_ge[order] / n_perm) / ranks
+    est = np.minimum.accumulate(est[::-1])[::-1]
+    q[order] = np.minimum(est, 1.0)
+    return q
+
+
+# empirical p-values and permutation FDR for every contrast
+# wd: proteins x samples, gi: groups.GroupIndex, pairs: list of key pairs
+# strata: metadata factor to shuffle within (e.g. 'PatientID'), or None
+# method: 'permutation' (shuffle labels) or 'bootstrap' (resample within
+#  groups after centring each group on its own mean)
+# returns {'t', 'p', 'fdr'}, each contrasts x proteins
+def permutation_test(wd, gi, pairs, n_perm=1000, by=groups.DEFAULT_BY,
+                     strata=None, method='permutation', equal_var=False,
+                     min_obs=2, seed=0, processes=None, chunk=100):
+    min_obs = max(min_obs, 2)
+    group_cols = gi.groups(by)
+    data = {}
+    for i, (a, b) in enumerate(pairs):
+        cols_a = group_cols[a]
+        cols_b = group_cols[b]
+        s = None
+        if strata is not None:
+            s = gi.values(strata, np.concatenate([cols_a, cols_b]))
+        d = prepare(wd, cols_a, cols_b, s, method)
+        # the observed statistic, same code path as the shuffles
+        # (the bootstrap data are centred per group, so not those)
+        od = d if method == 'permutation' else prepare(wd, cols_a, cols_b)
+        labels = d['labels'][:, None]
+        d['t'] = t_for_weights(od, labels, 1.0 - labels,
+                               equal_var, min_obs)[:, 0]
+        d['obs'] = np.abs(d['t'])
+        data[i] = d
+
+    # fixed chunks with their own random streams
+    sizes = [chunk]*(n_perm // chunk)
+    if n_perm % chunk:
+        sizes.append(n_perm % chunk)
+    tasks = []
+    for i in data:
+        seeds = np.random.SeedSequence([seed, i]).spawn(len(sizes))
+        for n, ss in zip(sizes, seeds):
+            tasks.append((i, n, ss, equal_var, min_obs))
+
+    n_proteins = wd.shape[0]
+    exceed = {i: np.zeros(n_proteins, dtype=np.int64) for i in data}
+    null_ge = {i: np.zeros(n_proteins, dtype=np.int64) for i in data}
+    # the counts are integers, so summing them as chunks finish gives
+    #  the same totals whatever the order
+    def collect(results):
+        for i, e, g in results:
+            exceed[i] += e
+            null_ge[i] += g
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1:
+        _init_worker(data)
+        collect(map(_run_chunk, tasks))
+    else:
+        with ProcessPoolExecutor(processes, initializer=_init_worker,
+                                 initargs=(data,)) as pool:
+            collect(pool.map(_run_chunk, tasks))
+
+    out = {k: np.full((len(pairs), n_proteins), np.nan)
+           for k in ('t', 'p', 'fdr')}
+    for i, d in data.items():
+        tested = ~np.isnan(d['obs'])
+        out['t'][i] = d['t']
+        out['p'][i][tested] = (1.0 + exceed[i][tested]) / (n_perm + 1.0)
+        out['fdr'][i] = _perm_fdr(d['obs'], null_ge[i], n_perm)
+    return out
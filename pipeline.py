@@ -0,0 +1,439 @@
+import os
+import glob
+import time
+import pickle
+import hashlib
+import inspect
+import numpy as np
+import render
+import plots
+import loader
+import annotations
+import store
+import groups
+import impute
+import normalize
+import contrasts
+import linmodel
+import fdr
+import significance
+import qc
+import presence
+import intersections
+import density
+import validate
+
+# the scripts' analysis as one staged run
+#   validate -> load -> qc -> impute -> normalize -> stats -> table -> plot
+# every stage's output (artifact) is cached under a key made from:
+#  - the stage's source and that of the functions here it calls, plus
+#    the source of the repo modules they use and of the repo modules
+#    those import (see stage_source)
+#  - the parameters the stage uses
+#  - the keys of the stages it takes input from, and for validate the
+#    sha1 of the data and metadata files
+# so a changed parameter or edited function only re-runs the stages
+#  downstream of the change; an unchanged run reads the cached plot
+#  and validate artifacts and nothing else
+# artifacts are pickled into <data>.store/artifacts/<stage>-<key>.pkl;
+#  only the CACHE_KEEP most recently used of every stage are kept
+
+DEFAULTS = {
+    'dtype': 'float64',
+    'by': groups.DEFAULT_BY,
+    'min_obs': 3,
+    'analysis': 'ttest',      # or 'paired', see volcano_2.py
+    'imputation': None,       # or 'downshift', 'minprob', 'knn'
+    'normalization': 'median',   # or 'mean', 'quantile' (normalize.py)
+    'equal_var': False,
+    'fdr': 'bh',
+    'min_lfc': significance.MIN_LFC,  # volcano thresholds
+    'min_lp': significance.MIN_LP,
+    'threshold': 6,           # upset presence threshold
+    'table': 'volcano_results.csv',   # or .npz, None for no table
+    'fmt': 'svg',
+    'out_dir': '.',
+    'report': None,           # pdf collecting every figure
+    'processes': None,        # render pool size
+}
+
+# artifacts kept per stage, so switching between a few parameter sets
+#  stays cached while the cache doesn't grow on every change
+CACHE_KEEP = 4
+
+
+# the input checks of R_testing/reworked_prepareInput.R (see validate.py)
+# raises if there is nothing to analyse; cached, so a file is only
+#  checked once per version
+# the rows and columns the checks kept (data file indices) are what the
+#  later stages analyse
+def validate_stage(inputs, params):
+    result = validate.prepare_input(params['csv'], params['meta'])
+    return {'notes': result['notes'], 'shape': result['wd'].shape,
+            'rows': result['rows'], 'cols': result['cols']}
+
+
+# the data come from the store, cut down to the rows and columns the
+#  checks kept (repeated and empty proteins, empty samples and samples
+#  not in the metadata are left out, samples in metadata order)
+# the matrix stays a memmap if that is all of it, otherwise only the
+#  kept columns are read; bits are the presence bits of what is kept
+def load_stage(inputs, params):
+    rows = inputs['validate']['rows']
+    cols = inputs['validate']['cols']
+    wd, annot, header = loader.load_matrix(
+        params['csv'], mmap=True, dtype=np.dtype(params['dtype']))
+    all_rows = len(rows) == wd.shape[0]
+    whole = all_rows and np.array_equal(cols, np.arange(wd.shape[1]))
+    if not whole:
+        wd = store.read_columns(wd, cols)
+        if not all_rows:
+            wd = wd[rows]
+    if all_rows:
+        bits = store.load_presence(params['csv'], params['dtype'])[0][cols]
+    else:
+        bits = presence.pack(wd)
+    annot = annot[rows]
+    header = np.concatenate([header[:loader.N_ANNOT],
+                             header[loader.N_ANNOT:][cols]])
+    gi = groups.GroupIndex.from_files(params['meta'], header)
+    return {'wd': wd, 'annot': annot, 'header': header, 'gi': gi,
+            'annotations': annotations.AnnotationTable(annot),
+            'cols': cols, 'all_rows': all_rows, 'whole': whole,
+            'bits': bits}
+
+
+# the QC table of the store, for the samples kept; made again from the
+#  data if proteins were left out
+def qc_stage(inputs, params):
+    load = inputs['load']
+    if not load['all_rows']:
+        return qc.summarize(load['wd'])
+    summary = qc.load_summary(params['csv'], np.dtype(params['dtype']))
+    return {k: v if k == 'edges' else v[load['cols']]
+            for k, v in summary.items()}
+
+
+# missing values filled in on log2 intensities (see impute.py), back on
+#  the intensity scale
+# the imputed matrix and the mask of what was imputed live in the store
+#  (so the plots can mark imputed points), which is also the cache; it
+#  covers the whole store, so when the checks left anything out only
+#  what is kept is imputed, in memory
+def impute_stage(inputs, params):
+    wd = inputs['load']['wd']
+    method = params['imputation']
+    if method is None:
+        return wd
+    if not inputs['load']['whole']:
+        return np.exp2(impute.impute(np.log2(wd), method))
+    dtype = np.dtype(params['dtype'])
+    found = store.load_imputed(params['csv'], method, dtype)
+    if found is None:
+        filled = np.exp2(impute.impute(np.log2(wd), method))
+        store.write_imputed(store.store_path(params['csv']), filled,
+                            impute.imputed_bits(wd, filled), method, dtype)
+        found = store.load_imputed(params['csv'], method, dtype)
+    return found[0]
+
+
+# normalized intensities, log2 first for the paired analysis
+# the medians for median centering come from the QC table (the measured
+#  values only, also when missing values were imputed)
+def normalize_stage(inputs, params):
+    wd = inputs['impute']
+    summary = inputs['qc']
+    method = params['normalization']
+    if params['analysis'] == 'paired':
+        medians = summary['median']*np.log2(10)
+        transform = 'log2'
+    else:
+        medians = summary['raw_median']
+        transform = None
+    return normalize.normalize(wd, transform, method,
+                               medians if method == 'median' else None)
+
+
+# every one-factor contrast, as in volcano_2.py
+def stats_stage(inputs, params):
+    gi = inputs['load']['gi']
+    norm = inputs['normalize']
+    by = params['by']
+    pairs = contrasts.one_factor_contrasts(gi.keys(by))
+    if params['analysis'] == 'paired':
+        results = linmodel.lm_contrasts(norm, gi, pairs, by)
+    else:
+        gstats = contrasts.GroupStats.from_blocks(gi.reordered(norm, by))
+        results = contrasts.run_contrasts(gstats, pairs,
+                                          equal_var=params['equal_var'],
+                                          min_obs=params['min_obs'])
+    results['q'] = fdr.adjust(results['p'], method=params['fdr'])
+    results['pairs'] = pairs
+    return results
+
+
+# the classified results table; its thresholds are plot parameters, so
+#  changing one leaves the tests above cached
+def table_stage(inputs, params):
+    return results_table(inputs['stats'], inputs['load']['annotations'],
+                         params)
+
+
+def results_table(results, annotations, params):
+    return significance.build_table(
+        results['log2fc'], results['p'], results['q'], annotations.labels(),
+        [contrasts.contrast_label(a, b) for a, b in results['pairs']],
+        params['min_lfc'], params['min_lp'])
+
+
+# the scripts' figures as render jobs, {name: job} in drawing order:
+#  protein_counts, cloud_<group> for every group, upset and volcano
+#  (more than one volcano figure with many contrasts)
+# names: only build these (e.g. the ones new data changed)
+# bits: presence bits of wd (as presence.pack), default the store's
+def figure_jobs(wd, gi, summary, table, params, names=None, bits=None):
+    by = params['by']
+    group_cols = list(gi.groups(by).values())
+    labels = gi.labels(by)
+    out = os.path.join(params['out_dir'], '{}')
+    fmt = params['fmt']
+    os.makedirs(params['out_dir'], exist_ok=True)
+    jobs = {}
+
+    def wanted(name):
+        return names is None or name in names
+
+    # protein counts
+    if wanted('protein_counts'):
+        jobs['protein_counts'] = render.job(
+            plots.plot_counts,
+            render.out_name(out.format('protein_counts'), fmt),
+            [summary['present'][c] for c in group_cols],
+            [summary['missing'][c] for c in group_cols],
+            labels)
+
+    # rainclouds, binned mode
+    dens = density.binned_kde(summary['hist'], summary['edges'])
+    grid = density.bin_centers(summary['edges'])
+    for z, cols in enumerate(group_cols):
+        name = 'cloud_{}'.format(gi.file_labels(by)[z])
+        if not wanted(name):
+            continue
+        block = store.read_columns(wd, cols)
+        samples = [np.log10(s[~np.isnan(s)]) for s in block.T]
+        violins = []
+        for c in cols:
+            keep = (grid >= summary['min'][c]) & (grid <= summary['max'][c])
+            violins.append((grid[keep], dens[c][keep]))
+        jobs[name] = render.job(plots.plot_cloud,
+                                render.out_name(out.format(name), fmt),
+                                samples, labels[z],
+                                density.box_stats(summary, cols), violins,
+                                seed=z)
+
+    # upset, from the packed presence bits
+    if wanted('upset'):
+        if bits is None:
+            bits = store.load_presence(params['csv'], params['dtype'])[0]
+        counts = presence.group_counts(bits, wd.shape[0], group_cols)
+        _, masks, sweep = intersections.threshold_sweep(
+            counts, [params['threshold']])
+        jobs['upset'] = render.job(plots.plot_upset,
+                                   render.out_name(out.format('upset'), fmt),
+                                   masks, sweep[0], labels)
+
+    # volcano, from the results table, VOLCANO_PER_PAGE contrasts to a
+    #  figure ('volcano', 'volcano_2', ...; asking for 'volcano' gets
+    #  them all)
+    for name, contrasts in plots.volcano_pages(len(table['contrasts'])):
+        if wanted('volcano') or wanted(name):
+            jobs[name] = render.job(plots.plot_volcano,
+                                    render.out_name(out.format(name), fmt),
+                                    table, contrasts=contrasts)
+    return jobs
+
+
+# render jobs (see figure_jobs) and write the results table
+# returns {'paths', 'renders'}
+def render_figures(jobs, table, params):
+    reports = render.render_all(list(jobs.values()),
+                                processes=params['processes'],
+                                report=params['report'])
+    paths = [r['path'] for r in reports]
+    if params['table'] is not None and table is not None:
+        paths.append(os.path.join(params['out_dir'], params['table']))
+        significance.save_table(paths[-1], table)
+    if params['report'] is not None:
+        paths.append(params['report'])
+    return {'paths': paths, 'renders': reports}
+
+
+# the four figures of the scripts, rendered together
+def plot_stage(inputs, params):
+    table = inputs['table']
+    load = inputs['load']
+    jobs = figure_jobs(load['wd'], load['gi'], inputs['qc'], table, params,
+                       bits=load['bits'])
+    return render_figures(jobs, table, params)
+
+
+# name, function, input stages, parameters used, cached
+STAGES = [
+    ('validate', validate_stage, (), (), True),
+    ('load', load_stage, ('validate',), ('dtype',), False),
+    ('qc', qc_stage, ('load',), ('dtype',), True),
+    ('impute', impute_stage, ('load',), ('imputation',), False),
+    ('normalize', normalize_stage, ('impute', 'qc'),
+     ('analysis', 'normalization'), True),
+    ('stats', stats_stage, ('load', 'normalize'),
+     ('by', 'min_obs', 'analysis', 'equal_var', 'fdr'), True),
+    ('table', table_stage, ('load', 'stats'), ('min_lfc', 'min_lp'), True),
+    ('plot', plot_stage, ('load', 'validate', 'qc', 'table'),
+     ('by', 'threshold', 'fmt', 'out_dir', 'report', 'table'), True),
+]
+
+
+# names a function's code (and the code nested in it) looks up
+def _code_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+
+# the repo module obj is, or that a function or class obj comes from
+def _repo_module(obj, here):
+    if inspect.isfunction(obj) or inspect.isclass(obj):
+        obj = inspect.getmodule(obj)
+    path = getattr(obj, '__file__', None) if inspect.ismodule(obj) else None
+    if path and os.path.dirname(os.path.abspath(path)) == here:
+        return obj
+    return None
+
+
+# source of a stage function, of the functions of this module it calls
+#  (and those call, ...) and of the other repo modules any of them refer
+#  to, with the repo modules those import, and so on, so an edit to
+#  anything the stage can reach gives it a new key
+def stage_source(func):
+    here = os.path.dirname(os.path.abspath(__file__))
+    funcs = {}
+    modules = {func.__module__: None}
+    todo = [func]
+    while todo:
+        obj = todo.pop()
+        if inspect.isfunction(obj) and obj.__module__ == func.__module__:
+            if obj.__name__ not in funcs:
+                funcs[obj.__name__] = inspect.getsource(obj)
+                todo.extend(obj.__globals__.get(n)
+                            for n in _code_names(obj.__code__))
+            continue
+        mod = _repo_module(obj, here)
+        if mod is None or mod.__name__ in modules:
+            continue
+        modules[mod.__name__] = inspect.getsource(mod)
+        todo.extend(vars(mod).values())
+    del modules[func.__module__]
+    return '\n'.join([funcs[n] for n in sorted(funcs)] +
+                     [modules[n] for n in sorted(modules)])
+
+
+def stage_key(func, params, dep_keys, extra=()):
+    h = hashlib.sha1()
+    for part in [stage_source(func), repr(sorted(params.items()))] + \
+            list(dep_keys) + list(extra):
+        h.update(part.encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def artifact_path(cache_dir, name, key):
+    return os.path.join(cache_dir, '{}-{}.pkl'.format(name, key[:20]))
+
+
+# remove all but the keep most recently used artifacts of a stage (the
+#  run touches an artifact whenever it reads one)
+def prune_artifacts(cache_dir, name, keep=CACHE_KEEP):
+    paths = glob.glob(artifact_path(cache_dir, name, '?' * 20))
+    paths.sort(key=lambda x: os.stat(x).st_mtime_ns, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # pruned by another run at the same time
+            pass
+
+
+# run the stages up to `until` (default all of them) for one dataset
+# force: stage names to re-run even if cached
+# params override DEFAULTS; returns {stage: artifact} for the stages
+#  that were needed (always validate), and prints what ran and what
+#  came from the cache
+def run(csv_path, meta_path, until='plot', force=(), cache_dir=None,
+        verbose=True, **params):
+    p = dict(DEFAULTS)
+    p.update(params)
+    p['csv'] = csv_path
+    p['meta'] = meta_path
+    # missing or empty files stop the run before anything is written
+    validate.check_file(csv_path, 'Data')
+    validate.check_file(meta_path, 'Metadata')
+    if cache_dir is None:
+        cache_dir = os.path.join(store.store_path(csv_path), 'artifacts')
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # every key is known before anything runs
+    stages = {s[0]: s for s in STAGES}
+    keys = {}
+    for name, func, deps, names, cached in STAGES:
+        extra = ()
+        if name == 'validate':
+            extra = (store.source_hash(csv_path), loader.file_hash(meta_path))
+        keys[name] = stage_key(func, {k: p[k] for k in names},
+                               [keys[d] for d in deps], extra)
+
+    out = {}
+
+    def get(name):
+        if name in out:
+            return out[name]
+        _, func, deps, names, cached = stages[name]
+        path = artifact_path(cache_dir, name, keys[name])
+        if cached and name not in force and os.path.exists(path):
+            with open(path, 'rb') as f:
+                out[name] = pickle.load(f)
+            # a plot artifact only counts if its files are still there
+            if name != 'plot' or all(os.path.exists(x)
+                                     for x in out[name]['paths']):
+                if verbose:
+                    print('{}: cached'.format(name))
+                os.utime(path)
+                return out[name]
+
+        inputs = {d: get(d) for d in deps}
+        start = time.perf_counter()
+        out[name] = func(inputs, p)
+        if verbose:
+            print('{}: ran in {:.2f} s'.format(
+                name, time.perf_counter() - start))
+        if cached:
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                pickle.dump(out[name], f)
+            os.replace(tmp, path)
+            prune_artifacts(cache_dir, name)
+        return out[name]
+
+    # the validate artifact (with the notes of the input checks) is
+    #  always returned, read from the cache if nothing else ran
+    get('validate')
+    if verbose:
+        for note in out['validate']['notes']:
+            print('{}: note: {}'.format(os.path.basename(csv_path), note))
+    get(until)
+    return out
+
+
+if __name__ == '__main__':
+    run('bmif-Example.csv', 'Metadata-Example-2.csv')
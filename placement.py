@@ -0,0 +1,121 @@
+import numpy as np
+
+# label placement for scatter plots (the volcano annotations)
+# labels are placed one at a time, most important first; each tries a
+#  few positions around its point (right, above right, below right,
+#  above, below and the same on the left) and takes the first whose box
+#  stays inside the axes and overlaps neither a label placed before it
+#  nor the marker of another labelled point; a label with no free
+#  position is dropped
+# placed boxes live in a uniform grid (cells about one label in size),
+#  so a box is only checked against the few boxes in the cells it covers
+#  and n labels take about n log n (the sort) instead of n^2
+#
+# everything is in display units (pixels at the figure's dpi), the
+#  offsets handed back are in points, for annotate(textcoords='offset
+#  points')
+
+# candidate positions as the alignment of the box on its point:
+#  (0, 0.5) is left aligned and vertically centred, i.e. right of the
+#  point; the order is the order they are tried in
+CANDIDATES = ((0, 0.5), (0, 0), (0, 1), (0.5, 0), (0.5, 1),
+              (1, 0.5), (1, 0), (1, 1))
+HA = {0: 'left', 0.5: 'center', 1: 'right'}
+VA = {0: 'bottom', 0.5: 'center', 1: 'top'}
+
+
+# boxes (x0, y0, x1, y1) on a grid of square cells
+class Grid:
+
+    def __init__(self, cell):
+        self.cell = float(cell)
+        self.cells = {}
+        self.boxes = []
+
+    def _keys(self, box):
+        x0, y0, x1, y1 = (int(np.floor(v / self.cell)) for v in box)
+        return [(i, j) for i in range(x0, x1 + 1) for j in range(y0, y1 + 1)]
+
+    def add(self, box):
+        self.boxes.append(box)
+        n = len(self.boxes) - 1
+        for k in self._keys(box):
+            self.cells.setdefault(k, []).append(n)
+
+    # True if box overlaps any box in the grid (touching doesn't count)
+    def hits(self, box):
+        x0, y0, x1, y1 = box
+        for k in self._keys(box):
+            for n in self.cells.get(k, ()):
+                b = self.boxes[n]
+                if x0 < b[2] and b[0] < x1 and y0 < b[3] and b[1] < y1:
+                    return True
+        return False
+
+
+# width and height (pixels) of each text as drawn at fontsize
+def text_sizes(fig, texts, fontsize, fontweight='normal'):
+    from matplotlib.font_manager import FontProperties
+    renderer = fig.canvas.get_renderer()
+    prop = FontProperties(size=fontsize, weight=fontweight)
+    sizes = np.zeros((len(texts), 2))
+    for i, s in enumerate(texts):
+        w, h, d = renderer.get_text_width_height_descent(s, prop,
+                                                         ismath=False)
+        sizes[i] = w, h
+    return sizes
+
+
+# place labels of the given sizes at anchors (n x 2 each, pixels)
+# priority: higher is placed first (default: in order)
+# max_labels: place at most this many, by priority
+# bounds: (x0, y0, x1, y1) the boxes have to stay in
+# marker: radius (pixels) of the point markers, kept free of labels
+# gap: distance (pixels) between a point and its label
+# side: +1 (or -1) per label to try the right (or left) positions first
+# dpi: for the offsets in points
+# returns the indices of the placed labels, their offsets (points) and
+#  their horizontal and vertical alignments
+def place(anchors, sizes, priority=None, max_labels=None, bounds=None,
+          marker=0.0, gap=2.0, side=None, dpi=72.0):
+    anchors = np.asarray(anchors, dtype=float).reshape(-1, 2)
+    sizes = np.asarray(sizes, dtype=float).reshape(-1, 2)
+    n = len(anchors)
+    if priority is None:
+        order = np.arange(n)
+    else:
+        order = np.argsort(-np.asarray(priority), kind='stable')
+    if max_labels is not None:
+        order = order[:max_labels]
+    if side is None:
+        side = np.ones(n)
+    gap = max(gap, marker + 1.0)
+
+    cell = max(np.median(sizes[order, 0]) if len(order) else 1.0, 1.0)
+    grid = Grid(cell)
+    for x, y in anchors[order]:
+        grid.add((x - marker, y - marker, x + marker, y + marker))
+
+    placed, offsets, align = [], [], []
+    for i in order:
+        x, y = anchors[i]
+        w, h = sizes[i]
+        for hx, hy in CANDIDATES:
+            if side[i] < 0:
+                hx = 1 - hx
+            x0 = x - hx*w + (1 - 2*hx)*gap
+            y0 = y - hy*h + (1 - 2*hy)*gap
+            box = (x0, y0, x0 + w, y0 + h)
+            if bounds is not None and (x0 < bounds[0] or y0 < bounds[1] or
+                                       box[2] > bounds[2] or
+                                       box[3] > bounds[3]):
+                continue
+            if grid.hits(box):
+                continue
+            grid.add(box)
+            placed.append(i)
+            offsets.append(((1 - 2*hx)*gap*72.0/dpi,
+                            (1 - 2*hy)*gap*72.0/dpi))
+            align.append((HA[hx], VA[hy]))
+            break
+    return np.array(placed, dtype=int), offsets, align
@@ -0,0 +1,494 @@
+import numpy as np
+import render
+import matplotlib.pyplot as plt
+from matplotlib.gridspec import GridSpec
+import intersections
+import density
+import significance
+import placement
+
+# the figures drawn by the scripts, one function per figure
+# every function takes the data it plots and returns the figure, which
+#  render.py saves and closes; nothing here loads or computes data, so
+#  the scripts, the pipeline and batch runs all draw the same figures
+
+colors_1=(
+        (0.1215686275, 0.4666666667, 0.7058823529, 1.0),
+        (1.0000000000, 0.4980392157, 0.0549019608, 1.0),
+        (0.1725490196, 0.6274509804, 0.1725490196, 1.0),
+        (0.8392156863, 0.1529411765, 0.1568627451, 1.0),
+        (0.5803921569, 0.4039215686, 0.7411764706, 1.0),
+        (0.5490196078, 0.3372549020, 0.2941176471, 1.0),
+        (0.8901960784, 0.4666666667, 0.7607843137, 1.0),
+        (0.4980392157, 0.4980392157, 0.4980392157, 1.0))
+
+colors_2=(
+        (0.6823529411764706, 0.7803921568627451, 0.90980392156862740, 1.0),
+        (1.0000000000000000, 0.7333333333333333, 0.47058823529411764, 1.0),
+        (0.5960784313725490, 0.8745098039215686, 0.54117647058823530, 1.0),
+        (1.0000000000000000, 0.5960784313725490, 0.58823529411764710, 1.0),
+        (0.7725490196078432, 0.6901960784313725, 0.83529411764705890, 1.0),
+        (0.7686274509803922, 0.6117647058823530, 0.58039215686274510, 1.0),
+        (0.9686274509803922, 0.7137254901960784, 0.82352941176470580, 1.0),
+        (0.7803921568627451, 0.7803921568627451, 0.78039215686274510, 1.0))
+
+# volcano point colors, indexed by significance class
+class_colors = np.zeros((len(significance.CLASSES), 4))
+class_colors[significance.UP] = (0.173, 0.627, 0.173, 1.0)
+class_colors[significance.DOWN] = (0.122, 0.467, 0.706, 1.0)
+class_colors[significance.UP_NS] = (0.596, 0.875, 0.541, 1.0)
+class_colors[significance.DOWN_NS] = (0.682, 0.780, 0.910, 1.0)
+class_colors[significance.NONE] = (1.000, 0.733, 0.471, 1.0)
+
+
+# draw the present/missing bars, one bar per sample and one block of
+#  bars per group
+# x1, x2: present and missing counts for each group's samples
+def plot_counts(x1, x2, group_labels):
+    n_groups = len(x1)
+
+    # plot params
+    l, r, t, b  = 0.3, 0.7, 0.8, 0.4
+    fig, ax = plt.subplots(figsize=(8.5,11))
+    plt.subplots_adjust(left=l, right=r, top=t, bottom=b)
+
+    # y-axis placement
+    # one bar per sample, groups stacked with a one bar gap between them
+    gap = 1
+    ys = []
+    start = 0
+    for c in x1:
+        ys.append(np.arange(start, start + len(c), gap))
+        start += len(c) + 1
+
+    # make a h-bar chart
+    for i in range(n_groups):
+        ax.barh(ys[i], x1[i], color = colors_1[0])
+        ax.barh(ys[i], x2[i], color = colors_2[0], left = x1[i])
+
+    # tick/spine/label formatting
+    ymax = start - 0.5
+    ymin = -1
+    plt.ylim(ymin, ymax)
+    plt.yticks([],[])
+    plt.tick_params(axis='x', width=1)
+    plt.xticks(np.arange(0, 501, step=100), fontsize=10, fontweight='demibold')
+    plt.xticks(ha='center')
+    for spine in ['top','right']:
+        ax.spines[spine].set_visible(False)
+    for spine in ['bottom','left']:
+        ax.spines[spine].set_linewidth(1)
+
+    # Y-axis labels, centred on each group of bars
+    x = l - 0.075
+    lims = ymax - ymin
+    for i in range(n_groups):
+        y1 = ax.get_position().bounds[1] + \
+            ((np.mean(ys[i]) - ymin)/lims*ax.get_position().bounds[3])
+        plt.figtext(x, y1, group_labels[i], fontsize=13, fontweight='demibold', ha='center', va='center')
+
+    # X-axis label
+    x = ax.get_position().bounds[0] + ax.get_position().bounds[2]/2
+    y = ax.get_position().bounds[1]-0.05
+    plt.figtext(x, y, 'Unique Protein Count', fontsize=13, fontweight='demibold', ha='center', va='center')
+
+    # legend labels
+    x0 = l
+    y0 = ax.get_position().bounds[1] - 0.1
+    dx = 0.25
+    labels = ['Present', 'Missing']
+    for i in range(2):
+        x1 = x0 + (dx*i)
+        plt.figtext(x1, y0, labels[i], fontsize=13, fontweight='demibold', ha='center', va='center')
+
+    # legend patches
+    pw = 0.06
+    ph = 0.021
+    x0 = l + 0.065
+    y0 = ax.get_position().bounds[1] - 0.1 - (0.5*ph)
+
+    x1 = x0
+    fig.patches.extend([plt.Rectangle((x1, y0), pw, ph, fill=True,
+                                      color=colors_1[0], transform=fig.transFigure,
+                                      figure=fig)])
+    x1 = x0 + dx
+    fig.patches.extend([plt.Rectangle((x1, y0), pw, ph, fill=True,
+                                      color=colors_2[0], transform=fig.transFigure,
+                                      figure=fig)])
+
+    #plt.show()
+    return fig
+
+
+# draw one group's raincloud
+# samples: log10 intensities of each sample (nans removed)
+# boxes: ax.bxp stats per sample, or None to work them out (ax.boxplot)
+# violins: (x, density) per sample, or None to work them out
+#  (ax.violinplot)
+# points: raw points shown per sample, 'all', 'subsample' (random) or
+#  'thin' (density aware, keeps the tails), at most max_points of them
+def plot_cloud(samples, title, boxes=None, violins=None, points='thin',
+               max_points=2000, seed=0):
+    n_samples = len(samples)
+    rng = np.random.default_rng(seed)
+
+    # set up the plot
+    l, r, t, b  = 0.2, 0.6, 0.8, 0.3
+    fig, ax = plt.subplots(figsize=(8.5,11))
+    plt.subplots_adjust(left=l, right=r, top=t, bottom=b,
+                        hspace=0.05, wspace=0.05)
+
+    # boxplot + formatting
+    if boxes is not None:
+        bp = ax.bxp(boxes,
+                    patch_artist = True, orientation='horizontal',
+                    showfliers=False,
+                    widths=0.2, positions=range(1,n_samples+1))
+    else:
+        bp = ax.boxplot(samples, patch_artist = True,
+                    orientation='horizontal', showfliers=False,
+                    widths=0.2, positions=range(1,n_samples+1))
+
+    for median in bp['medians']:
+        median.set_color('black')
+    for box in bp['boxes']:
+        box.set(color='k')
+    for patch in bp['boxes']:
+        patch.set_facecolor(colors_1[0])
+
+    # violin plot (top half only)
+    if violins is not None:
+        # half width 0.25 at the peak, as violinplot draws it
+        # (a sample with no values gets no violin)
+        for idx, (vx, d) in enumerate(violins):
+            if len(d) == 0 or not d.max() > 0:
+                continue
+            ax.fill_between(vx, idx+1, idx+1 + 0.25*d/d.max(),
+                            color=colors_2[0], alpha=1)
+    else:
+        vp = ax.violinplot(samples, points=100,
+                                showmeans=False, showextrema=False,
+                                showmedians=False, orientation='horizontal')
+        # mask bottom of violin plot + formatting
+        for idx, b in enumerate(vp['bodies']):
+            b.get_paths()[0].vertices[:, 1] = np.clip(b.get_paths()[0].vertices[:, 1], idx+1, idx+2)
+            b.set_color(colors_2[0])
+            b.set_alpha(1)
+
+    # scatter plot, every sample in one call
+    xs = []
+    for features in samples:
+        if points == 'subsample':
+            features = density.subsample(features, max_points, rng)
+        elif points == 'thin':
+            features = density.thin(features, max_points, rng)
+        xs.append(features)
+    y = np.repeat(np.arange(n_samples) + 0.8, [len(f) for f in xs])
+    y += rng.uniform(low=-0.05, high=0.05, size=len(y))
+    ax.scatter(np.concatenate(xs), y, s=0.3, c='0.3')
+
+    # format the plot
+    plt.xlim(-0.5, 10)
+    plt.tick_params(axis='both', width=1)
+    plt.xticks(np.arange(0, 11, step=1), ['0','','2','','4','','6','','8','','10'],
+               fontsize=10, fontweight='demibold')
+    plt.yticks(np.arange(1, n_samples+1, step=1),
+               fontsize=10, fontweight='demibold')
+    plt.xticks(ha='center')
+    for spine in ['top','right']:
+        ax.spines[spine].set_visible(False)
+    for spine in ['bottom','left']:
+        ax.spines[spine].set_linewidth(1)
+
+    # X-axis label
+    x = ax.get_position().bounds[0] + ax.get_position().bounds[2]/2
+    y = ax.get_position().bounds[1]-0.05
+    plt.figtext(x, y, 'Log10(intensity)', fontsize=13, fontweight='demibold', ha='center', va='center')
+
+    # Y-axis label
+    x = ax.get_position().bounds[0] - 0.1
+    y = ax.get_position().bounds[1] + ax.get_position().bounds[3]/2
+    plt.figtext(x, y, 'Sample ID', fontsize=13, fontweight='demibold', ha='center', va='center')
+
+    # Header label
+    x = ax.get_position().bounds[0] + ax.get_position().bounds[2]/2
+    y = ax.get_position().bounds[1] + ax.get_position().bounds[3] + 0.02
+    plt.figtext(x, y, title, fontsize=13, fontweight='demibold', ha='center', va='center')
+
+    #plt.show()
+    return fig
+
+
+# draw the UpSet plot for one row of the sweep table: the sweep's masks
+#  and that row's counts
+# (any threshold can be drawn from the table without reloading the data)
+def plot_upset(masks, counts, labels, min_size=1, top_k=None):
+    n_sets = len(labels)
+
+    # plotting data - the size of each intersecting set
+    inter_masks, p_data = intersections.select(masks, counts, n_sets,
+                                               min_size=min_size, top_k=top_k)
+    n_inter = len(inter_masks)
+
+    # more plotting data - the size of the base set
+    set_sizes = intersections.set_sizes(masks, counts, n_sets)
+
+    # figure parameters
+    fig, ax = plt.subplots(figsize=(8.5,11))
+    gs = GridSpec(5, 5, figure=fig)
+    l, r, t, b  = 0.2, 0.8, 0.9, 0.3
+    plt.subplots_adjust(left=l, right=r, top=t, bottom=b, wspace=0.025)
+
+    # set up first axis; format the axis
+    # plot the vertical bar chart
+    ax1 = plt.subplot2grid((5,5), (0,2), colspan=4, rowspan=2)
+    for spine in ['top','right']:
+        ax1.spines[spine].set_visible(False)
+    for spine in ['bottom','left']:
+        ax1.spines[spine].set_linewidth(1)
+    sizes = plt.bar(range(n_inter), p_data, color =colors_1[0], width=0.8)
+
+    # add labels above bars with the size of the intersections
+    for p in sizes:
+       height = p.get_height()
+       ax1.annotate('{}'.format(height),
+          xy=(p.get_x() + p.get_width() / 2, height),
+          xytext=(0, 3),
+          textcoords="offset points",
+          ha='center', va='bottom', fontsize=6)
+
+    # plot formatting
+    # y-axis runs to the next 100 above the largest intersection
+    ymax = 100*np.ceil(max(p_data, default=0)*1.1/100)
+    plt.tick_params(axis='y', width=1)
+    plt.ylim(0, ymax)
+    plt.yticks(np.linspace(0, ymax, 5), fontsize=10, fontweight='demibold')
+    plt.xlim(-1, n_inter)
+    plt.xticks([],[])
+
+    # Y-axis label
+    x = ax1.get_position().bounds[0] - 0.15
+    y = ax1.get_position().bounds[1] + (ax1.get_position().bounds[3]/2)
+    plt.figtext(x, y, 'Intersection\nSize', fontsize=13, fontweight='demibold', ha='center', va='center')
+
+    # set up the second plot + some formatting
+    # this isn't a plot, but the colored dots under the primary figure
+    # used a scatter plot and manually made dark/light dots to
+    # represent which groups are being represented
+    ax2 = plt.subplot2grid((5,5), (2,2), colspan=4, rowspan=1)
+    for spine in ['top','right','bottom','left']:
+        ax2.spines[spine].set_visible(False)
+    for i in range(n_sets):
+        plt.scatter(np.arange(0, n_inter, 1), np.full((n_inter,), i, dtype=int), color=colors_2[0], s=50)
+    plt.xlim(-1, n_inter)
+    plt.ylim(-0.5, n_sets - 0.5)
+    plt.xticks([],[])
+    plt.yticks([],[])
+
+    # add in dots for what was actually analysed
+    # (the bits set in each intersection's mask)
+    dots = [(j, i) for j, m in enumerate(inter_masks)
+            for i in intersections.decode(m, n_sets)]
+    if dots:
+        dx, dy = zip(*dots)
+        plt.scatter(dx, dy, color=colors_1[0], s=50)
+
+    # Y-axis labels
+    y_labs = labels
+    x = ax2.get_position().bounds[0] - 0.05
+    y = ax2.get_position().bounds[1] + (0.5/n_sets*ax2.get_position().bounds[3])
+    for i in range(n_sets):
+        y1 = y + (i*1/n_sets*ax2.get_position().bounds[3])
+        plt.figtext(x, y1, y_labs[i], fontsize=11, fontweight='demibold', ha='center', va='center')
+
+    # set up the 3rd plot - the left hort. bar chart
+    ax3 = plt.subplot2grid((5,5), (2,0), colspan=1, rowspan=1)
+    for spine in ['top','left']:
+        ax3.spines[spine].set_visible(False)
+    for spine in ['bottom','right']:
+        ax3.spines[spine].set_linewidth(1)
+
+    # annotate with the size of each set
+    xmax = 100*np.ceil(max(set_sizes, default=0)*1.1/100)
+    sizes_2 = plt.barh(range(n_sets), set_sizes, 0.5)
+    for i, v in enumerate(set_sizes):
+        ax3.text(v + 0.22*xmax, i, str(v), fontsize=6, ha='left', va='center')
+
+    # format the plot
+    plt.yticks([],[])
+    plt.ylim(-0.5, n_sets - 0.5)
+    plt.xlim(0, xmax)
+    # label every other tick
+    xt = np.linspace(0, xmax, 5)
+    plt.xticks(xt, ['{:g}'.format(v) if i % 2 == 0 else '' for i, v in enumerate(xt)],
+               fontsize=10, fontweight='demibold')
+    plt.tick_params(axis='x', width=1)
+    ax3.invert_xaxis()
+
+    # x-axis label
+    x = ax3.get_position().bounds[0] + (ax3.get_position().bounds[2]/2)
+    y = ax3.get_position().bounds[1] + ax3.get_position().bounds[3] + 0.02
+    plt.figtext(x, y, 'Set size', fontsize=13, fontweight='demibold', ha='center', va='center')
+
+    #plt.show()
+    return fig
+
+
+# contrasts per volcano figure: two rows of two panels
+VOLCANO_PER_PAGE = 4
+
+
+# file stem and contrast indices of every volcano figure for a table
+#  with n_contrasts: 'volcano', then 'volcano_2', 'volcano_3', ...
+def volcano_pages(n_contrasts, per_page=VOLCANO_PER_PAGE):
+    return [('volcano' if s == 0 else 'volcano_{}'.format(s//per_page + 1),
+             np.arange(s, min(s + per_page, n_contrasts)))
+            for s in range(0, n_contrasts, per_page)]
+
+
+# draw one volcano panel per contrast from a results table
+#  (see significance.py); the point colors and the labelled proteins
+#  follow the table's classes, the dashed lines its thresholds
+# max_labels: most labels per panel, by significance (None for all that
+#  fit)
+# contrasts: indices of the contrasts to draw (default all); with more
+#  than VOLCANO_PER_PAGE use volcano_pages to spread them over figures
+def plot_volcano(table, max_labels=50, label_size=7, contrasts=None):
+    if contrasts is None:
+        contrasts = np.arange(len(table['contrasts']))
+    titles = [table['contrasts'][c] for c in contrasts]
+    n_contrasts = len(titles)
+    min_lfc = float(table['min_lfc'])
+    min_lp = float(table['min_lp'])
+
+    # plot params
+    # one panel per contrast, two panels per row
+    l, r, t, b  = 0.3, 0.9, 0.9, 0.4
+    n_rows = (n_contrasts + 1)//2
+    fig, ax = plt.subplots(nrows=n_rows, ncols=2,
+                           figsize=(8.5,11))
+    plt.subplots_adjust(left=l, right=r, top=t, bottom=b,
+                        hspace=0.3)
+    # an odd number of contrasts leaves the last cell empty
+    for a in np.ravel(ax)[n_contrasts:]:
+        fig.delaxes(a)
+
+    # reminder
+    # xdata: log2 ratio of means
+    # ydata: -log10 of the corrected pvals
+
+    axes = []
+    for i in range(n_contrasts):
+        # create the plotting axis
+        pnum=i+1
+        axes.append(plt.subplot(n_rows,2,pnum))
+
+        rows = significance.contrast_rows(table, contrasts[i])
+        x = table['log2fc'][rows]
+        with np.errstate(divide='ignore'):
+            y = -np.log10(table['q'][rows])
+        classes = table['class'][rows]
+
+        # plot the data, one color per class
+        size = 20
+        plt.scatter(x, y, c=class_colors[classes], s=size,
+                    edgecolors='0.3', linewidths=0.5)
+
+        # add some dashed indicator lines
+        plt.plot([-min_lfc,-min_lfc],[0,6.5], alpha=0.5,
+                 c='0.5', linestyle='--')
+        plt.plot([min_lfc,min_lfc],[0,6.5], alpha=0.5,
+                 c='0.5', linestyle='--')
+        plt.plot([-10,10],[min_lp,min_lp], alpha=0.5,
+                 c='0.5', linestyle='--')
+
+        # formatting
+        plt.xlim(-8, 8)
+        plt.ylim(0, 6.5)
+
+        # annotations for the significantly higher (right of the point)
+        #  and lower (left) proteins, using the protein names
+        # the max_labels most significant are placed where they don't
+        #  overlap each other or the other labelled points (see
+        #  placement.py), the rest are left out
+        hits = np.flatnonzero((classes == significance.UP) |
+                              (classes == significance.DOWN))
+        names = table['names'][table['protein'][rows[hits]]]
+        anchors = axes[i].transData.transform(np.column_stack([x[hits],
+                                                               y[hits]]))
+        placed, offsets, align = placement.place(
+            anchors, placement.text_sizes(fig, names, label_size),
+            priority=np.lexsort((np.abs(x[hits]), y[hits])).argsort(),
+            max_labels=max_labels, bounds=axes[i].bbox.extents,
+            marker=(np.sqrt(size)/2 + 0.5)*fig.dpi/72, dpi=fig.dpi,
+            side=np.sign(x[hits]))
+        for j, xy, (ha, va) in zip(placed, offsets, align):
+            axes[i].annotate(names[j], (x[hits[j]], y[hits[j]]), xytext=xy,
+                             textcoords='offset points', ha=ha, va=va,
+                             fontsize=label_size)
+
+    # loop over axes and add ticks where appropriate
+    for i in range(n_contrasts):
+        plt.sca(axes[i])
+        plt.xticks(np.arange(-8, 8.1, 1),
+                   ['','','-6','','','-3','','','0','','','3','','','6','',''],
+                   fontsize=10, fontweight='demibold')
+        plt.yticks(np.arange(0, 6.1, 1),
+                   ['0','','2','','4','','6'],
+                   fontsize=10, fontweight='demibold')
+        plt.tick_params(axis='both', width=1)
+
+    # format axes
+    for a in axes:
+        for spine in ['top','right']:
+            a.spines[spine].set_visible(False)
+        for spine in ['bottom','left']:
+            a.spines[spine].set_linewidth(1)
+
+    # X-axis label
+    x = l + (0.5*(r-l))
+    y = b-0.05
+    plt.figtext(x, y, 'log2(ratio of means)', fontsize=13,
+                fontweight='demibold', ha='center', va='center')
+
+    # Y-axis label
+    x = l -0.065
+    y = b + (0.5*(t-b))
+    plt.figtext(x, y, '-log10(p-value)', fontsize=13, fontweight='demibold',
+                rotation='vertical', ha='center', va='center')
+
+    #Add titles to each plot
+    for i in range(n_contrasts):
+        x = axes[i].get_position().bounds[0] + axes[i].get_position().bounds[2]/2
+        y = axes[i].get_position().bounds[1] + axes[i].get_position().bounds[2]*0.85
+        plt.figtext(x, y, titles[i], fontsize=11.5, fontweight='demibold',
+                    ha='center', va='center')
+
+    # legend
+    x0 = l
+    y0 = b - 0.125
+    d  = 0.032
+    h = 0.022
+    order = [significance.UP, significance.DOWN, significance.UP_NS,
+             significance.DOWN_NS, significance.NONE]
+    colors = class_colors[order]
+    fc = '{:g}'.format(min_lfc)
+    lp = '{:g}'.format(min_lp)
+    text = ['log2(ratio) > {} & log10(pval) > {}'.format(fc, lp),
+            'log2(ratio) < -{} & log10(pval) > {}'.format(fc, lp),
+            'log2(ratio) > {} & log10(pval) < {}'.format(fc, lp),
+            'log2(ratio) < -{} & log10(pval) < {}'.format(fc, lp),
+            '-{} < log2(ratio) > {}'.format(fc, fc)]
+
+    for i in range(5):
+        y1 = y0 - (i*d)
+        fig.patches.extend([plt.Rectangle((x0, y1), h, (h*8.5/11), fill=True,
+                                          color=colors[i], transform=fig.transFigure,
+                                          figure=fig)])
+        x2 = x0 + 2*h
+        y2 = y1 + 0.4*h
+        plt.figtext(x2, y2, text[i], fontsize=11.5, fontweight='demibold', ha='left', va='center')
+
+
+    #plt.show()
+    return fig
@@ -0,0 +1,83 @@
+import numpy as np
+
+# bit-packed presence (not nan) matrix
+# one bit per protein x sample: row s holds the proteins seen in sample s,
+#  packed 8 proteins to a byte (np.packbits order), so a 100k x 2000
+#  matrix is 25 MB instead of 200 MB of booleans
+# counts come from popcounts of the packed bytes, and set operations on
+#  proteins (and, or, and-not) run directly on the packed rows
+
+# number of set bits in every byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(packed, axis=None):
+    return _POPCOUNT[packed].sum(axis=axis, dtype=np.int64)
+
+
+# pack the presence of wd (proteins x samples) sample by sample
+# chunk_cols samples are read at a time, so wd can be a memmap
+def pack(wd, chunk_cols=256):
+    n_proteins, n_samples = wd.shape
+    bits = np.empty((n_samples, (n_proteins + 7) // 8), dtype=np.uint8)
+    for s in range(0, n_samples, chunk_cols):
+        e = min(s + chunk_cols, n_samples)
+        bits[s:e] = np.packbits(~np.isnan(np.asarray(wd[:, s:e]).T), axis=1)
+    return bits
+
+
+# back to booleans (proteins x samples) for the given samples
+def unpack(bits, n_proteins, samples=None):
+    if samples is not None:
+        bits = bits[samples]
+    return np.unpackbits(bits, axis=1, count=n_proteins).T.astype(bool)
+
+
+# proteins present in each sample
+def sample_counts(bits):
+    return popcount(bits, axis=1)
+
+
+# samples each protein is present in, over the given samples (default all)
+# summed in chunks of samples so only chunk x proteins bytes are unpacked
+def protein_counts(bits, n_proteins, samples=None, chunk=64):
+    if samples is None:
+        samples = np.arange(len(bits))
+    counts = np.zeros(n_proteins, dtype=np.int64)
+    for s in range(0, len(samples), chunk):
+        block = bits[samples[s:s + chunk]]
+        counts += np.unpackbits(block, axis=1, count=n_proteins).sum(
+            axis=0, dtype=np.int64)
+    return counts
+
+
+# proteins x groups table of how many of each group's samples a protein
+#  was seen in; groups is a list of sample index arrays
+def group_counts(bits, n_proteins, groups):
+    return np.column_stack([protein_counts(bits, n_proteins, g)
+                            for g in groups])
+
+
+# packed set of the proteins seen in at least threshold of the samples
+# threshold=1 is an or over the rows, all samples an and
+def group_set(bits, n_proteins, samples, threshold=1):
+    samples = np.asarray(samples)
+    if threshold <= 1:
+        return np.bitwise_or.reduce(bits[samples], axis=0)
+    if threshold == len(samples):
+        return np.bitwise_and.reduce(bits[samples], axis=0)
+    counts = protein_counts(bits, n_proteins, samples)
+    return np.packbits(counts >= threshold)
+
+
+# proteins in every one of sets_in and in none of sets_out (packed rows)
+def exclusive(sets_in, sets_out=()):
+    out = np.bitwise_and.reduce(np.asarray(sets_in), axis=0)
+    if len(sets_out):
+        out = out & ~np.bitwise_or.reduce(np.asarray(sets_out), axis=0)
+    return out
+
+
+# protein (row) indices in a packed set
+def indices(packed, n_proteins):
+    return np.flatnonzero(np.unpackbits(packed, count=n_proteins))
@@ -0,0 +1,141 @@
+import os
+import csv
+import warnings
+import numpy as np
+import loader
+import store
+
+# per-sample QC table from a single pass over the matrix
+# the matrix is read chunk_cols samples at a time (whole columns, which
+#  are contiguous in the store), and everything the plots need about a
+#  sample is worked out from that one read:
+#   present, missing      - protein counts
+#   min, max, mean        - of log10 intensity
+#   q1, median, q3        - quartiles of log10 intensity (as np.percentile)
+#   whislo, whishi        - 1.5 IQR whisker ends, as matplotlib's boxplot
+#   raw_median            - median intensity (for median normalization)
+#   hist                  - log10 intensity histogram on shared edges, so
+#                           densities can be smoothed without the data
+# the table is a dict of arrays, one entry per sample, plus 'edges'
+
+FIELDS = ('present', 'missing', 'min', 'max', 'mean', 'q1', 'median', 'q3',
+          'whislo', 'whishi', 'raw_median')
+
+# histogram range (log10 intensity) and number of bins
+# values outside the range are counted in the end bins
+HIST_RANGE = (-1.0, 11.0)
+N_BINS = 480
+
+
+def summarize(wd, chunk_cols=64, n_bins=N_BINS, hist_range=HIST_RANGE):
+    n_proteins, n_samples = wd.shape
+    out = {k: np.empty(n_samples) for k in FIELDS}
+    out['hist'] = np.zeros((n_samples, n_bins), dtype=np.int64)
+    out['edges'] = np.linspace(hist_range[0], hist_range[1], n_bins + 1)
+    width = (hist_range[1] - hist_range[0]) / n_bins
+
+    for s in range(0, n_samples, chunk_cols):
+        e = min(s + chunk_cols, n_samples)
+        x = np.asarray(wd[:, s:e], dtype=np.float64)
+        present = ~np.isnan(x)
+        out['present'][s:e] = present.sum(axis=0)
+        out['missing'][s:e] = n_proteins - out['present'][s:e]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lx = np.log10(x)
+        lx[~np.isfinite(lx)] = np.nan
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # all-nan samples
+            out['raw_median'][s:e] = np.nanmedian(x, axis=0)
+            out['min'][s:e] = np.nanmin(lx, axis=0)
+            out['max'][s:e] = np.nanmax(lx, axis=0)
+            out['mean'][s:e] = np.nanmean(lx, axis=0)
+            q1, med, q3 = np.nanpercentile(lx, [25, 50, 75], axis=0)
+            iqr = q3 - q1
+            out['whislo'][s:e] = np.nanmin(
+                np.where(lx >= q1 - 1.5*iqr, lx, np.nan), axis=0)
+            out['whishi'][s:e] = np.nanmax(
+                np.where(lx <= q3 + 1.5*iqr, lx, np.nan), axis=0)
+        out['q1'][s:e] = q1
+        out['median'][s:e] = med
+        out['q3'][s:e] = q3
+
+        # histograms of every sample in the chunk from one bincount, each
+        #  sample offset into its own row
+        ok = ~np.isnan(lx)
+        b = np.clip(((lx[ok] - hist_range[0]) / width).astype(np.int64),
+                    0, n_bins - 1)
+        b += np.nonzero(ok)[1] * n_bins
+        out['hist'][s:e] = np.bincount(
+            b, minlength=(e - s)*n_bins).reshape(e - s, n_bins)
+
+    for k in ('present', 'missing'):
+        out[k] = out[k].astype(np.int64)
+    return out
+
+
+def summary_path(spath, dtype=np.float32):
+    return os.path.join(spath, 'qc_{}.npz'.format(np.dtype(dtype).name))
+
+
+# the QC table for csv_path, kept in its store next to the matrix
+# recomputed when the store has been rebuilt or the bins have changed
+def load_summary(csv_path, dtype=np.float32, n_annot=loader.N_ANNOT,
+                 n_bins=N_BINS, hist_range=HIST_RANGE):
+    matrix = store.load_store(csv_path, dtype, n_annot)[0]
+    spath = store.store_path(csv_path)
+    qpath = summary_path(spath, dtype)
+    edges = np.linspace(hist_range[0], hist_range[1], n_bins + 1)
+
+    if os.path.exists(qpath) and \
+            os.stat(qpath).st_mtime_ns >= \
+            os.stat(store.matrix_path(spath, dtype)).st_mtime_ns:
+        with np.load(qpath) as cached:
+            if np.array_equal(cached['edges'], edges) and \
+                    len(cached['present']) == matrix.shape[1]:
+                return {k: cached[k] for k in cached.files}
+
+    summary = summarize(matrix, n_bins=n_bins, hist_range=hist_range)
+    _write(qpath, summary)
+    return summary
+
+
+def _write(qpath, summary):
+    tmp = qpath[:-len('.npz')] + '.tmp.npz'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **summary)
+    os.replace(tmp, qpath)
+
+
+# after store.append_columns: summarize only the new columns and add
+#  them to the cached table (all of it is summarized if there is no
+#  table for the old columns)
+def extend_summary(csv_path, cols, dtype=np.float32, n_annot=loader.N_ANNOT,
+                   n_bins=N_BINS, hist_range=HIST_RANGE):
+    matrix = store.load_store(csv_path, dtype, n_annot)[0]
+    qpath = summary_path(store.store_path(csv_path), dtype)
+    edges = np.linspace(hist_range[0], hist_range[1], n_bins + 1)
+    n_old = matrix.shape[1] - len(cols)
+    if os.path.exists(qpath):
+        with np.load(qpath) as cached:
+            old = {k: cached[k] for k in cached.files}
+        if np.array_equal(old['edges'], edges) and \
+                len(old['present']) == n_old:
+            new = summarize(matrix[:, n_old:], n_bins=n_bins,
+                            hist_range=hist_range)
+            summary = {k: old[k] if k == 'edges' else
+                       np.concatenate([old[k], new[k]]) for k in old}
+            _write(qpath, summary)
+            return summary
+    if os.path.exists(qpath):
+        os.remove(qpath)
+    return load_summary(csv_path, dtype, n_annot, n_bins, hist_range)
+
+
+# the table as csv, one row per sample (histograms left out)
+def save_summary(path, summary, samples):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('sample',) + FIELDS)
+        for i, name in enumerate(samples):
+            writer.writerow([name] + [summary[k][i].item() for k in FIELDS])
@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+# figure rendering for the plotting scripts
+# importing this module switches matplotlib to the headless Agg backend,
+#  so import it before pyplot
+# a plot function draws one figure from its arguments and returns it;
+#  render() saves the figure and closes it (and anything else the plot
+#  function opened), so nothing piles up over hundreds of figures
+# render_all() spreads independent figures over a process pool; the plot
+#  functions have to be module-level (picklable) and the scripts calling
+#  it need an `if __name__ == '__main__':` guard (workers re-import them
+#  on windows)
+#
+# the output format follows the file extension (svg, svgz, pdf, png)
+# point layers with more than raster_points points are rasterized, at
+#  dpi, while axes and text stay vector; every figure of a run can also
+#  be collected into a multi-page pdf report
+
+FORMATS = ('svg', 'svgz', 'pdf', 'png')
+RASTER_POINTS = 1000
+DPI = 300
+
+
+# one render job: the plot function, where to save and its arguments
+def job(func, out_path, *args, **kwargs):
+    return func, out_path, args, kwargs
+
+
+# output name for a format, e.g. out_name('upset', 'pdf') -> 'upset.pdf'
+def out_name(stem, fmt='svg'):
+    if fmt not in FORMATS:
+        raise ValueError('unknown format {!r}, expected one of {}'.format(
+            fmt, ', '.join(FORMATS)))
+    return '{}.{}'.format(stem, fmt)
+
+
+# rasterize the scatter (or other collection) layers with many points
+def rasterize_dense(fig, raster_points=RASTER_POINTS):
+    for ax in fig.axes:
+        for c in ax.collections:
+            if len(c.get_offsets()) > raster_points:
+                c.set_rasterized(True)
+
+
+# peak resident memory of this process so far, in MB (nan on windows)
+# this counts everything drawing takes, the Agg and freetype buffers as
+#  well as python and numpy
+def peak_rss_mb():
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+# draw, save and close one job's figure
+# returns {'path', 'seconds', 'peak_mb'}, peak_mb being the peak memory
+#  of the process that drew it (see peak_rss_mb) once it was saved; in a
+#  process that has drawn other figures (or loaded data) before, that is
+#  the largest of them; with keep=True the pickled figure comes back too
+#  (for the report)
+def render(task, raster_points=RASTER_POINTS, dpi=DPI, keep=False):
+    func, out_path, args, kwargs = task
+    before = set(plt.get_fignums())
+    start = time.perf_counter()
+    try:
+        fig = func(*args, **kwargs)
+        if raster_points is not None:
+            rasterize_dense(fig, raster_points)
+        fig.savefig(out_path, dpi=dpi)
+        kept = pickle.dumps(fig) if keep else None
+    finally:
+        for num in set(plt.get_fignums()) - before:
+            plt.close(num)
+    out = {'path': out_path, 'seconds': time.perf_counter() - start,
+           'peak_mb': peak_rss_mb()}
+    if keep:
+        out['figure'] = kept
+    return out
+
+
+def _run(args):
+    return render(*args)
+
+
+# render every job, in a pool of processes (default: one per job, up to
+#  the number of cpus); reports come back in job order
+# report: pdf path (or an open PdfPages) to add every figure to, as one
+#  page each in job order
+def render_all(jobs, processes=None, raster_points=RASTER_POINTS, dpi=DPI,
+               report=None):
+    if processes is None:
+        processes = min(len(jobs), os.cpu_count() or 1)
+    tasks = [(task, raster_points, dpi, report is not None) for task in jobs]
+    if processes <= 1:
+        results = [_run(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_run, tasks))
+
+    if report is not None:
+        pdf = PdfPages(report) if isinstance(report, str) else report
+        try:
+            for r in results:
+                fig = pickle.loads(r.pop('figure'))
+                pdf.savefig(fig, dpi=dpi)
+                plt.close(fig)
+        finally:
+            if isinstance(report, str):
+                pdf.close()
+    return results
+
+
+def print_report(reports):
+    for r in reports:
+        print('{}: {:.2f} s, peak {:.1f} MB'.format(
+            r['path'], r['seconds'], r['peak_mb']))
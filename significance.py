@@ -0,0 +1,83 @@
+import os
+import csv
+import numpy as np
+
+# significance classes for the volcano plots and the results table
+# every protein in every contrast gets a class from its log2 fold change
+#  and -log10(q), all at once:
+#   up / down       - log2fc beyond +-min_lfc and -log10(q) > min_lp
+#   up_ns / down_ns - log2fc beyond +-min_lfc and -log10(q) < min_lp
+#   none            - everything else, including untested proteins
+# the defaults are the dashed lines of the volcano plots: |log2 ratio| > 1
+#  and q < 0.01
+#
+# the table is long format, one row per contrast and protein (contrast
+#  by contrast, proteins in data order), with the protein names and
+#  contrast labels stored once and the rows pointing into them
+CLASSES = ('none', 'up', 'down', 'up_ns', 'down_ns')
+NONE, UP, DOWN, UP_NS, DOWN_NS = range(len(CLASSES))
+MIN_LFC = 1.0
+MIN_LP = 2.0
+COLUMNS = ('protein', 'contrast', 'log2fc', 'p', 'q', 'class')
+
+
+# class codes (int8) for arrays of log2 fold changes and -log10(q)
+def classify(log2fc, lp, min_lfc=MIN_LFC, min_lp=MIN_LP):
+    log2fc = np.asarray(log2fc)
+    lp = np.asarray(lp)
+    sig = lp > min_lp
+    ns = lp < min_lp
+    up = log2fc > min_lfc
+    down = log2fc < -min_lfc
+    return np.select([sig & up, sig & down, ns & up, ns & down],
+                     [UP, DOWN, UP_NS, DOWN_NS], NONE).astype(np.int8)
+
+
+# the results table from contrasts x proteins arrays
+# names: one per protein, contrast_labels: one per contrast
+def build_table(log2fc, p, q, names, contrast_labels, min_lfc=MIN_LFC,
+                min_lp=MIN_LP):
+    log2fc = np.asarray(log2fc, dtype=float)
+    n_contrasts, n_proteins = log2fc.shape
+    with np.errstate(divide='ignore'):
+        lp = -np.log10(q)
+    return {
+        'protein': np.tile(np.arange(n_proteins), n_contrasts),
+        'contrast': np.repeat(np.arange(n_contrasts), n_proteins),
+        'log2fc': log2fc.ravel(),
+        'p': np.asarray(p, dtype=float).ravel(),
+        'q': np.asarray(q, dtype=float).ravel(),
+        'class': classify(log2fc, lp, min_lfc, min_lp).ravel(),
+        'names': np.asarray(names, dtype=str),
+        'contrasts': np.asarray(contrast_labels, dtype=str),
+        'min_lfc': np.float64(min_lfc),
+        'min_lp': np.float64(min_lp),
+    }
+
+
+# rows of one contrast, in protein order
+def contrast_rows(table, i):
+    return np.flatnonzero(table['contrast'] == i)
+
+
+# write the table as csv (names and labels spelled out) or, for a .npz
+#  path, as the arrays themselves (read back with load_table)
+def save_table(path, table):
+    if os.path.splitext(path)[1] == '.npz':
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, **table)
+        os.replace(tmp, path)
+        return
+    classes = np.array(CLASSES)[table['class']]
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(zip(table['names'][table['protein']].tolist(),
+                             table['contrasts'][table['contrast']].tolist(),
+                             table['log2fc'].tolist(), table['p'].tolist(),
+                             table['q'].tolist(), classes.tolist()))
+
+
+def load_table(path):
+    with np.load(path) as f:
+        return {k: f[k] for k in f.files}
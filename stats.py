@@ -0,0 +1,81 @@
+import numpy as np
+import scipy.stats as sci_ss
+
+# vectorized hypothesis tests
+# every function works on whole matrices (proteins x samples) at once
+#  and returns one value per protein as numpy arrays
+# the nan_ versions skip missing values: counts, means and variances are
+#  taken over the values present in each row
+
+
+# per-row count of present values, mean and variance (ddof=1)
+# rows with fewer than 1 (mean) or 2 (variance) values give nan
+def nan_moments(x):
+    x = np.asarray(x, dtype=float)
+    present = ~np.isnan(x)
+    n = present.sum(axis=1).astype(float)
+    filled = np.where(present, x, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m = filled.sum(axis=1) / n
+        d = np.where(present, x - m[:, None], 0.0)
+        v = (d*d).sum(axis=1) / (n - 1)
+    v[n < 2] = np.nan
+    return n, m, v
+
+
+# t statistic and degrees of freedom from group means (m),
+#  variances (v, ddof=1) and sizes (n)
+# equal_var=False is Welch's test, True the pooled-variance test
+# n can be a scalar or an array (one n per protein)
+def t_from_stats(m1, v1, n1, m2, v2, n2, equal_var=False):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if equal_var:
+            df = n1 + n2 - 2.0
+            pooled = ((n1 - 1)*v1 + (n2 - 1)*v2) / df
+            se = np.sqrt(pooled * (1.0/n1 + 1.0/n2))
+        else:
+            vn1 = v1 / n1
+            vn2 = v2 / n2
+            se = np.sqrt(vn1 + vn2)
+            df = (vn1 + vn2)**2 / (vn1**2/(n1 - 1) + vn2**2/(n2 - 1))
+        t = (m1 - m2) / se
+    df = np.broadcast_to(df, np.shape(t)).astype(float)
+    return t, df
+
+
+# as t_from_stats, plus the two-sided p-value
+def ttest_from_stats(m1, v1, n1, m2, v2, n2, equal_var=False):
+    t, df = t_from_stats(m1, v1, n1, m2, v2, n2, equal_var)
+    p = 2 * sci_ss.t.sf(np.abs(t), df)
+    return t, df, p
+
+
+# two-sample t-test of every row of a against the same row of b
+# a: proteins x n1 samples, b: proteins x n2 samples
+# same results as scipy.stats.ttest_ind run row by row
+def ttest_ind(a, b, equal_var=False):
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    n1 = a.shape[1]
+    n2 = b.shape[1]
+    return ttest_from_stats(a.mean(axis=1), a.var(axis=1, ddof=1), n1,
+                            b.mean(axis=1), b.var(axis=1, ddof=1), n2,
+                            equal_var)
+
+
+# nan result for proteins with fewer than min_obs values in either group
+def apply_min_obs(n1, n2, min_obs, *arrays):
+    bad = (n1 < min_obs) | (n2 < min_obs)
+    for a in arrays:
+        a[bad] = np.nan
+    return arrays
+
+
+# ttest_ind with missing values: each protein is tested on the values
+#  it has, proteins with fewer than min_obs values in a group give nan
+# same results as scipy.stats.ttest_ind(nan_policy='omit') row by row
+def nan_ttest_ind(a, b, equal_var=False, min_obs=2):
+    n1, m1, v1 = nan_moments(a)
+    n2, m2, v2 = nan_moments(b)
+    t, df, p = ttest_from_stats(m1, v1, n1, m2, v2, n2, equal_var)
+    return apply_min_obs(n1, n2, max(min_obs, 2), t, df, p)
@@ -0,0 +1,380 @@
+import io
+import os
+import csv
+import hashlib
+from itertools import islice
+import numpy as np
+import loader
+import presence
+
+# on-disk matrix store for data that doesn't fit in memory
+# layout, for bmif-Example.csv:
+#   bmif-Example.store/matrix_float32.npy  - intensities, proteins x samples
+#   bmif-Example.store/index.npz           - header, annotation columns (row
+#                                            names) and the csv it came from
+# float64 is opt-in and sits next to the float32 copy (matrix_float64.npy)
+#   bmif-Example.store/presence.npy        - bit-packed presence matrix,
+#                                            samples x proteins/8 (presence.py)
+#   bmif-Example.store/qc_float32.npz      - per-sample QC table (qc.py)
+#   bmif-Example.store/imputed_knn_float64.npy
+#                                          - imputed matrix (impute.py), one
+#                                            per method, same layout
+#   bmif-Example.store/imputed_knn_mask.npy
+#                                          - which values were imputed, packed
+#                                            as presence.npy
+#   bmif-Example.store/incremental_float64.pkl
+#                                          - saved analysis for incremental
+#                                            updates (incremental.py)
+# the matrix is written in fortran (column-major) order so every sample
+#  is one contiguous block on disk; reading the columns of a group only
+#  touches those blocks
+
+
+def store_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.store'
+
+
+def matrix_path(spath, dtype=np.float32):
+    return os.path.join(spath, 'matrix_{}.npy'.format(np.dtype(dtype).name))
+
+
+def presence_path(spath):
+    return os.path.join(spath, 'presence.npy')
+
+
+# pack the presence bits of a finished matrix into the store
+def write_presence(spath, matrix):
+    tmp = presence_path(spath) + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, presence.pack(matrix))
+    os.replace(tmp, presence_path(spath))
+
+
+# stream the csv into the store chunk_rows lines at a time
+# the csv is read twice (once to count rows, once to convert) but
+#  never held in memory as a whole
+def build_store(csv_path, dtype=np.float32, n_annot=loader.N_ANNOT,
+                chunk_rows=10000):
+    spath = store_path(csv_path)
+    os.makedirs(spath, exist_ok=True)
+    st = os.stat(csv_path)
+
+    # a changed csv makes everything in the store stale, not just
+    #  the dtype being rebuilt
+    if not index_valid(spath, csv_path, n_annot):
+        for name in os.listdir(spath):
+            if name.startswith(('matrix_', 'qc_', 'imputed_')) or \
+                    name == 'presence.npy':
+                os.remove(os.path.join(spath, name))
+
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        header = np.array(next(reader), dtype=str)
+        n_rows = sum(1 for _ in reader)
+    n_cols = len(header)
+
+    tmp = matrix_path(spath, dtype) + '.tmp'
+    matrix = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype,
+                                       shape=(n_rows, n_cols - n_annot),
+                                       fortran_order=True)
+    annots = []
+    rows_hash = hashlib.sha1()
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        s = 0
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                break
+            hash_rows(rows_hash, rows)
+            e = s + len(rows)
+            matrix[s:e], annot = loader.parse_rows(rows, n_cols, n_annot, dtype)
+            annots.append(annot)
+            s = e
+    matrix.flush()
+    if not os.path.exists(presence_path(spath)):
+        write_presence(spath, matrix)
+    del matrix
+    os.replace(tmp, matrix_path(spath, dtype))
+
+    if annots:
+        annot = np.concatenate(annots)
+    else:
+        annot = np.empty((0, n_annot), dtype=str)
+    write_index(spath, header, annot, n_annot, st, loader.file_hash(csv_path),
+                rows_hash.hexdigest())
+    return spath
+
+
+# bring the store up to date with a csv that only gained sample columns
+#  at the end (same proteins, same order, same cells before them)
+# the csv is read once to check its old cells against the index's
+#  rows_sha1 and once to convert the new columns; the matrix grows in
+#  place (new columns go at the end of the fortran-ordered file, only its
+#  header is rewritten) and the presence bits are extended
+# returns the matrix indices of the new columns (empty if there are
+#  none), or None if the csv changed in any other way (or there is no
+#  store to extend) and the store has to be rebuilt
+# other dtypes and imputed matrices are removed, the QC table of this
+#  dtype is left for qc.extend_summary
+def append_columns(csv_path, dtype=np.float32, n_annot=loader.N_ANNOT,
+                   chunk_rows=10000):
+    spath = store_path(csv_path)
+    ipath = os.path.join(spath, 'index.npz')
+    mpath = matrix_path(spath, dtype)
+    if not os.path.exists(ipath) or not os.path.exists(mpath):
+        return None
+    if index_valid(spath, csv_path, n_annot):
+        return np.empty(0, dtype=int)
+    with np.load(ipath) as index:
+        old_header = index['header']
+        old_annot = index['annot']
+        old_rows = str(index['rows_sha1']) if 'rows_sha1' in index else ''
+        if int(index['n_annot']) != n_annot or not old_rows:
+            return None
+    n_old = len(old_header)
+    n_rows = len(old_annot)
+    old_shape = np.load(mpath, mmap_mode='r').shape
+    if old_shape != (n_rows, n_old - n_annot):
+        return None
+
+    # the cells that were in the csv must not have changed
+    st = os.stat(csv_path)
+    old_hash, new_hash = hashlib.sha1(), hashlib.sha1()
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        header = np.array(next(reader), dtype=str)
+        if len(header) <= n_old or \
+                not np.array_equal(header[:n_old], old_header):
+            return None
+        n = 0
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                break
+            hash_rows(old_hash, rows, n_old)
+            hash_rows(new_hash, rows)
+            n += len(rows)
+    if n != n_rows or old_hash.hexdigest() != old_rows:
+        return None
+
+    n_new = len(header) - n_old
+    if not grow_columns(mpath, n_new):
+        return None
+    matrix = np.load(mpath, mmap_mode='r+')
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        s = 0
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                break
+            e = s + len(rows)
+            matrix[s:e, old_shape[1]:] = loader.parse_rows(
+                [r[:n_annot] + r[n_old:] for r in rows], n_annot + n_new,
+                n_annot, dtype)[0]
+            s = e
+    matrix.flush()
+
+    # presence rows are samples, so the new ones go at the end
+    bits = np.concatenate([np.load(presence_path(spath)),
+                           presence.pack(matrix[:, old_shape[1]:])])
+    del matrix
+    ptmp = presence_path(spath) + '.tmp'
+    with open(ptmp, 'wb') as f:
+        np.save(f, bits)
+    os.replace(ptmp, presence_path(spath))
+
+    keep = (os.path.basename(mpath), 'presence.npy',
+            'qc_{}.npz'.format(np.dtype(dtype).name), 'index.npz')
+    for name in os.listdir(spath):
+        if name.startswith(('matrix_', 'qc_', 'imputed_')) and \
+                name not in keep:
+            os.remove(os.path.join(spath, name))
+    write_index(spath, header, old_annot, n_annot, st,
+                loader.file_hash(csv_path), new_hash.hexdigest())
+    return np.arange(n_old, len(header)) - n_annot
+
+
+# add the first n cells of every csv row to a sha1, so a csv that gained
+#  columns can be checked against the one the store was built from
+#  (whatever its quoting or line endings)
+def hash_rows(h, rows, n=None):
+    h.update(''.join('\x1f'.join(r[:n]) + '\n' for r in rows).encode())
+
+
+# grow a fortran-ordered .npy file by n_new (zero) columns in place:
+#  numpy leaves room in the header for the shape to grow, so only the
+#  header is rewritten and the file extended; the columns already there
+#  are neither read nor written
+# returns False, with the file unchanged, if the new header doesn't fit
+def grow_columns(path, n_new):
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+        if not fortran or len(shape) != 2:
+            return False
+        shape = (shape[0], shape[1] + n_new)
+        header = io.BytesIO()
+        d = {'descr': np.lib.format.dtype_to_descr(dtype),
+             'fortran_order': True, 'shape': shape}
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, d)
+        else:
+            np.lib.format.write_array_header_2_0(header, d)
+        if len(header.getvalue()) != offset:
+            return False
+        f.seek(0)
+        f.write(header.getvalue())
+        f.truncate(offset + shape[0] * shape[1] * dtype.itemsize)
+    return True
+
+
+# write an in-memory matrix (e.g. from loader.load_matrix) as a store
+def write_store(spath, wd, annot, header, dtype=np.float32,
+                n_annot=loader.N_ANNOT):
+    os.makedirs(spath, exist_ok=True)
+    tmp = matrix_path(spath, dtype) + '.tmp'
+    matrix = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype,
+                                       shape=wd.shape, fortran_order=True)
+    matrix[:] = wd
+    matrix.flush()
+    write_presence(spath, matrix)
+    del matrix
+    os.replace(tmp, matrix_path(spath, dtype))
+    write_index(spath, header, annot, n_annot)
+    return spath
+
+
+# the sidecar index: row names (annotation columns), column names
+#  (header) and, for stores built from a csv, its size/mtime/sha1 and
+#  the sha1 of its cells (see hash_rows)
+def write_index(spath, header, annot, n_annot, st=None, sha1='',
+                rows_sha1=''):
+    tmp = os.path.join(spath, 'index.tmp.npz')
+    with open(tmp, 'wb') as f:
+        np.savez(f, header=header, annot=annot, n_annot=n_annot,
+                 size=st.st_size if st else -1,
+                 mtime=st.st_mtime_ns if st else -1, sha1=sha1,
+                 rows_sha1=rows_sha1)
+    os.replace(tmp, os.path.join(spath, 'index.npz'))
+
+
+# open a store zero-copy
+# returns the matrix (read-only memmap), annotation columns and header
+def open_store(spath, dtype=np.float32, mode='r'):
+    matrix = np.load(matrix_path(spath, dtype), mmap_mode=mode)
+    with np.load(os.path.join(spath, 'index.npz')) as index:
+        return matrix, index['annot'], index['header']
+
+
+# was the store's index built from this version of the csv
+# an index found valid by its hash (the csv was touched or copied) is
+#  written again with the new size and mtime, so the csv is hashed once
+def index_valid(spath, csv_path, n_annot=loader.N_ANNOT):
+    ipath = os.path.join(spath, 'index.npz')
+    if not os.path.exists(ipath):
+        return False
+    st = os.stat(csv_path)
+    with np.load(ipath) as index:
+        if int(index['n_annot']) != n_annot or \
+                not loader.cache_valid(index, st, csv_path):
+            return False
+        touched = int(index['mtime']) != st.st_mtime_ns
+        if touched:
+            header, annot, sha1 = index['header'], index['annot'], \
+                str(index['sha1'])
+            rows_sha1 = str(index['rows_sha1']) \
+                if 'rows_sha1' in index else ''
+    if touched:
+        write_index(spath, header, annot, n_annot, st, sha1, rows_sha1)
+    return True
+
+
+# is the store next to csv_path up to date (and of the wanted dtype)
+def store_valid(csv_path, dtype=np.float32, n_annot=loader.N_ANNOT):
+    spath = store_path(csv_path)
+    return os.path.exists(matrix_path(spath, dtype)) and \
+        index_valid(spath, csv_path, n_annot)
+
+
+# open the store for csv_path, (re)building it first if it is stale
+def load_store(csv_path, dtype=np.float32, n_annot=loader.N_ANNOT):
+    if not store_valid(csv_path, dtype, n_annot):
+        build_store(csv_path, dtype, n_annot)
+    return open_store(store_path(csv_path), dtype)
+
+
+# read only the given sample columns into memory
+# with the column-major layout this is one contiguous read per column
+def read_columns(matrix, cols):
+    return np.asarray(matrix[:, cols])
+
+
+# the bit-packed presence matrix for csv_path and the number of proteins
+#  it covers; read straight from the store when it is up to date (any
+#  dtype), otherwise the store is built first, as dtype
+def load_presence(csv_path, dtype=np.float32, n_annot=loader.N_ANNOT):
+    spath = store_path(csv_path)
+    if not (os.path.exists(presence_path(spath)) and
+            index_valid(spath, csv_path, n_annot)):
+        load_store(csv_path, dtype, n_annot)
+    with np.load(os.path.join(spath, 'index.npz')) as index:
+        n_proteins = len(index['annot'])
+    return np.load(presence_path(spath)), n_proteins
+
+
+# sha1 of the csv contents, taken from the store index when it is up to
+#  date (the csv is only read again if its size or mtime changed)
+def source_hash(csv_path, n_annot=loader.N_ANNOT):
+    spath = store_path(csv_path)
+    if index_valid(spath, csv_path, n_annot):
+        with np.load(os.path.join(spath, 'index.npz')) as index:
+            if str(index['sha1']):
+                return str(index['sha1'])
+    return loader.file_hash(csv_path)
+
+
+def imputed_path(spath, method, dtype=np.float32):
+    return os.path.join(spath, 'imputed_{}_{}.npy'.format(
+        method, np.dtype(dtype).name))
+
+
+def mask_path(spath, method):
+    return os.path.join(spath, 'imputed_{}_mask.npy'.format(method))
+
+
+# write an imputed matrix and its mask (packed bits, see
+#  impute.imputed_bits) next to the matrix it came from
+def write_imputed(spath, imputed, bits, method, dtype=np.float32):
+    tmp = imputed_path(spath, method, dtype) + '.tmp'
+    matrix = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype,
+                                       shape=imputed.shape, fortran_order=True)
+    matrix[:] = imputed
+    matrix.flush()
+    del matrix
+    os.replace(tmp, imputed_path(spath, method, dtype))
+    tmp = mask_path(spath, method) + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, bits)
+    os.replace(tmp, mask_path(spath, method))
+
+
+# the imputed matrix (read-only memmap) and mask bits for csv_path, or
+#  None if there are none or they are older than the matrix
+def load_imputed(csv_path, method, dtype=np.float32, n_annot=loader.N_ANNOT):
+    spath = store_path(csv_path)
+    paths = (imputed_path(spath, method, dtype), mask_path(spath, method))
+    if not store_valid(csv_path, dtype, n_annot) or \
+            not all(os.path.exists(p) for p in paths):
+        return None
+    built = os.stat(matrix_path(spath, dtype)).st_mtime_ns
+    if any(os.stat(p).st_mtime_ns < built for p in paths):
+        return None
+    return np.load(paths[0], mmap_mode='r'), np.load(paths[1])
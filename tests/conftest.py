@@ -0,0 +1,27 @@
+import os
+import sys
+import shutil
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# the example data and the R fixtures
+# tests only read from here; anything that writes next to its csv (the
+#  store, caches) works on a copy in a temporary directory
+R_TESTING = os.path.join(ROOT, 'R_testing')
+
+
+@pytest.fixture(scope='session')
+def r_testing():
+    return R_TESTING
+
+
+# (data, metadata) paths of a copy of the example, shared by the tests
+@pytest.fixture(scope='session')
+def example(tmp_path_factory):
+    work = tmp_path_factory.mktemp('example')
+    for name in ('bmif-Example.csv', 'Metadata-Example-2.csv'):
+        shutil.copy(os.path.join(R_TESTING, name), work)
+    return (str(work / 'bmif-Example.csv'),
+            str(work / 'Metadata-Example-2.csv'))
@@ -0,0 +1,20 @@
+import numpy as np
+import loader
+import annotations
+
+
+# the table against the string-based version
+def test_table_matches_strings(example):
+    wd, annot, header = loader.load_matrix(example[0], mmap=True)
+    table = annotations.AnnotationTable(annot)
+    assert np.array_equal(table.labels(), loader.first_names(annot))
+    assert np.array_equal(table.groups(), annot[:, 0])
+    assert np.array_equal(table.genes(), annot[:, 1])
+    for i, (g, n) in enumerate(annot):
+        assert i in table.rows_of_group(g)
+        for a in g.split(';'):
+            assert i in table.rows(a)
+        for s in n.split(';'):
+            assert i in table.rows(s)
+    shuffled = annotations.AnnotationTable(annot[::-1])
+    assert np.array_equal(table.join(shuffled), np.arange(len(annot))[::-1])
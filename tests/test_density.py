@@ -0,0 +1,29 @@
+import numpy as np
+import scipy.stats as sci_ss
+import loader
+import qc
+import density
+
+
+def test_binned_kde_close_to_scipy(example):
+    wd, annot, header = loader.load_matrix(example[0], mmap=True)
+    summary = qc.summarize(wd)
+    dens = density.binned_kde(summary['hist'], summary['edges'])
+    c = density.bin_centers(summary['edges'])
+    for i in range(wd.shape[1]):
+        x = np.log10(np.asarray(wd[:, i], dtype=float))
+        x = x[~np.isnan(x)]
+        exact = sci_ss.gaussian_kde(x)(c)
+        # relative to the peak
+        assert np.abs(dens[i] - exact).max() / exact.max() < 0.01
+
+
+def test_subsets_keep_at_most_max_points():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=50000)
+    for f in (density.subsample, density.thin):
+        y = f(x, 2000, rng)
+        assert len(y) <= 2000
+        assert np.isin(y, x).all()
+    # the sparse tails are thinned least
+    assert density.thin(x, 2000, rng).max() == x.max()
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+import statsmodels.stats.multitest as ssm
+import fdr
+
+
+@pytest.fixture
+def p():
+    rng = np.random.default_rng(0)
+    p = rng.random((50, 3000))**2
+    p[rng.random(p.shape) < 0.1] = np.nan
+    return p
+
+
+@pytest.mark.parametrize('method, sm_method', [
+    ('bh', 'fdr_bh'), ('by', 'fdr_by'), ('bonferroni', 'bonferroni')])
+def test_adjust_matches_statsmodels(p, method, sm_method):
+    q = fdr.adjust(p, method)
+    for i in range(len(p)):
+        ok = ~np.isnan(p[i])
+        ref = ssm.multipletests(p[i][ok], method=sm_method)[1]
+        assert np.allclose(q[i][ok], ref, rtol=1e-12, atol=0)
+        assert np.isnan(q[i][~ok]).all()
+    assert np.allclose(fdr.adjust(p.T, method, axis=0), q.T, equal_nan=True)
+
+
+def test_pooled_matches_statsmodels_on_flattened(p):
+    ok = ~np.isnan(p)
+    ref = ssm.multipletests(p[ok], method='fdr_bh')[1]
+    assert np.allclose(fdr.adjust(p, 'bh', pooled=True)[ok], ref, rtol=1e-12)
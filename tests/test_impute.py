@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+import loader
+import presence
+import impute
+
+
+@pytest.fixture(scope='module')
+def x(example):
+    wd, annot, header = loader.load_matrix(example[0], mmap=True,
+                                           dtype=np.float64)
+    return np.log2(wd)
+
+
+# against a plain loop over the rows with missing values
+def test_knn_matches_loop(x):
+    k = 5
+    fast = impute.knn(x, k=k, candidates=len(x), fallback=None,
+                      block_rows=50)
+    for i in np.flatnonzero(np.isnan(x).any(axis=1))[:40]:
+        shared = ~np.isnan(x[i]) & ~np.isnan(x)
+        d = np.array([np.sum((x[i, s] - x[l, s])**2) * x.shape[1] / s.sum()
+                      if s.sum() and l != i else np.inf
+                      for l, s in enumerate(shared)])
+        for j in np.flatnonzero(np.isnan(x[i])):
+            donors = [l for l in np.argsort(d, kind='stable')
+                      if np.isfinite(d[l]) and not np.isnan(x[l, j])][:k]
+            expected = x[donors, j].mean() if donors else np.nan
+            assert np.allclose(fast[i, j], expected, equal_nan=True)
+    assert np.array_equal(fast[~np.isnan(x)], x[~np.isnan(x)])
+
+
+@pytest.mark.parametrize('method', impute.METHODS)
+def test_imputed_bits_mark_every_missing_value(x, method):
+    out = impute.impute(x, method)
+    bits = impute.imputed_bits(x, out)
+    assert presence.popcount(bits) == np.isnan(x).sum()
+
+
+def test_knn_threads_agree():
+    rng = np.random.default_rng(1)
+    big = rng.normal(20, 2, (1000, 50)) + rng.normal(0, 1, (1000, 1))
+    big[rng.random(big.shape) < 0.2] = np.nan
+    assert np.array_equal(impute.knn(big, threads=1),
+                          impute.knn(big, threads=4), equal_nan=True)
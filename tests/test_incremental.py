@@ -0,0 +1,67 @@
+import os
+import csv
+import shutil
+import numpy as np
+import pytest
+import loader
+import store
+import qc
+import pipeline
+import incremental
+
+
+def grow(rows, path, n):
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(r[:loader.N_ANNOT + n] for r in rows)
+
+
+@pytest.fixture
+def work(r_testing, tmp_path):
+    shutil.copy(os.path.join(r_testing, 'Metadata-Example-2.csv'),
+                tmp_path / 'meta.csv')
+    return tmp_path
+
+
+def read_rows(r_testing, name):
+    with open(os.path.join(r_testing, name), newline='') as f:
+        return list(csv.reader(f))
+
+
+# grow a copy of the example data a few runs at a time and check every
+#  step against a full run on the same columns
+def test_updates_match_full_runs(r_testing, work):
+    rows = read_rows(r_testing, 'bmif-Example.csv')
+    data, meta = str(work / 'grow.csv'), str(work / 'meta.csv')
+    for n in (16, 28, 32):
+        grow(rows, data, n)
+        out = incremental.update(data, meta, out_dir=str(work / 'figs'),
+                                 processes=1, verbose=False)
+        assert out['full'] == (n == 16)
+        state = incremental._load_state(incremental.state_path(data))
+
+        check = str(work / 'check_{}.csv'.format(n))
+        shutil.copy(data, check)
+        ref = pipeline.run(check, meta, until='stats', verbose=False)
+        for k in incremental.RESULT_KEYS:
+            assert np.allclose(state['results'][k], ref['stats'][k],
+                               equal_nan=True, rtol=1e-9), k
+        summary = qc.load_summary(data, np.float64)
+        fresh = qc.summarize(loader.load_matrix(check, mmap=True,
+                                                dtype=np.float64)[0])
+        for k in fresh:
+            assert np.allclose(summary[k], fresh[k], equal_nan=True), k
+        assert np.array_equal(store.load_presence(data)[0],
+                              store.load_presence(check)[0])
+
+
+# proteins the input checks leave out make it a pipeline.run every time
+def test_dropped_rows_run_the_pipeline(r_testing, work):
+    rows = read_rows(r_testing, 'bmif-Example_duplicated_row.csv')
+    data, meta = str(work / 'grow.csv'), str(work / 'meta.csv')
+    for n in (16, 32):
+        grow(rows, data, n)
+        out = incremental.update(data, meta, out_dir=str(work / 'figs'),
+                                 processes=1, verbose=False)
+        assert out['full']
+        assert not os.path.exists(incremental.state_path(data))
+
@@ -0,0 +1,49 @@
+import warnings
+import numpy as np
+import statsmodels.api as sm
+import loader
+import groups
+import normalize
+import contrasts
+import linmodel
+
+
+def test_contrasts_match_statsmodels(example):
+    data, meta = example
+    wd, annot, header = loader.load_matrix(data, mmap=True, dtype=np.float64)
+    gi = groups.GroupIndex.from_files(meta, header)
+    y = normalize.normalize(wd, 'log2', 'median')
+    cols, X, names = linmodel.design_matrix(gi)
+    model = linmodel.fit(y[:, cols], X)
+    n = 0
+    with warnings.catch_warnings():
+        # designs left rank deficient by missing samples are expected
+        warnings.simplefilter('ignore',
+                              sm.tools.sm_exceptions.SingularMatrixWarning)
+        for a, b in contrasts.one_factor_contrasts(gi.keys()):
+            c = np.zeros(len(names))
+            c[names.index(a)] = 1.0
+            c[names.index(b)] = -1.0
+            est, t, df, p = linmodel.test_contrast(model, c, moderated=False)
+            for i in np.flatnonzero(~np.isnan(est)):
+                keep = ~np.isnan(y[i, cols])
+                res = sm.OLS(y[i, cols][keep], X[keep]).fit().t_test(c)
+                assert np.isclose(est[i], res.effect[0], rtol=1e-8,
+                                  atol=1e-10)
+                assert np.isclose(t[i], res.tvalue[0, 0], rtol=1e-6)
+                assert np.isclose(p[i], res.pvalue, rtol=1e-6, atol=1e-300)
+                assert df[i] == res.df_denom
+                n += 1
+    assert n > 0
+
+
+# variances s0 * chi2(d0)/d0 as the prior, each seen through its own
+#  chi2 with df residual degrees of freedom
+def test_fit_prior_recovers_simulated_prior():
+    rng = np.random.default_rng(0)
+    d0, s0 = 6.0, 0.3
+    df = rng.integers(2, 12, 20000).astype(float)
+    true = s0 * d0 / rng.chisquare(d0, len(df))
+    sigma2 = true * rng.chisquare(df) / df
+    fitted = linmodel.fit_prior(sigma2, df)
+    assert abs(fitted[0] - d0) < 0.5 and abs(fitted[1] - s0) < 0.01
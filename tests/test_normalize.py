@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+import loader
+import normalize
+
+
+@pytest.fixture(scope='module')
+def wd(example):
+    return loader.load_matrix(example[0], mmap=True, dtype=np.float64)[0]
+
+
+def test_median_centering_exact(wd):
+    lx = normalize.normalize(wd, 'log2', 'median')
+    for j in range(wd.shape[1]):
+        col = np.log2(wd[:, j])
+        col = col - np.median(col[~np.isnan(col)])
+        assert np.allclose(lx[:, j], col, equal_nan=True)
+
+
+# textbook quantile normalization on complete rows
+def test_quantile_normalize_textbook(wd):
+    full = np.log2(wd[~np.isnan(wd).any(axis=1)])
+    expected = np.empty_like(full)
+    mean_sorted = np.sort(full, axis=0).mean(axis=1)
+    for j in range(full.shape[1]):
+        expected[np.argsort(full[:, j]), j] = mean_sorted
+    assert np.allclose(normalize.quantile_normalize(full), expected)
+
+
+# merging = one big sketch, and every quantile within alpha of the order
+#  statistics around it (between two far apart values the sketch may
+#  land anywhere in the gap, as np.quantile does)
+def test_sketch_quantiles_within_alpha(wd):
+    sk = normalize.sketch(wd, chunk_rows=50)
+    half = normalize.sketch(wd[:300], chunk_rows=64).merge(
+        normalize.sketch(wd[300:], chunk_rows=64))
+    assert np.array_equal(sk.counts, half.counts)
+    probs = np.array([0.1, 0.5, 0.9])
+    est = sk.quantile(probs)
+    for j in range(wd.shape[1]):
+        col = np.sort(wd[:, j][~np.isnan(wd[:, j])])
+        r = probs*(len(col) - 1)
+        lo = col[np.floor(r).astype(int)] * (1 - normalize.ALPHA)
+        hi = col[np.ceil(r).astype(int)] * (1 + normalize.ALPHA)
+        assert ((est[:, j] >= lo) & (est[:, j] <= hi)).all()
+
+
+# typically within the sketch's relative error, on the log2 scale
+@pytest.mark.parametrize('method', ['median', 'mean', 'quantile'])
+@pytest.mark.parametrize('transform', ['log2', 'glog'])
+def test_chunked_close_to_exact(wd, method, transform):
+    exact = normalize.normalize(wd, transform, method)
+    chunked = normalize.normalize(wd, transform, method, chunk_rows=100)
+    assert np.array_equal(np.isnan(exact), np.isnan(chunked))
+    diff = np.abs(exact - chunked)
+    assert np.nanmedian(diff) < np.log2(1 + 2*normalize.ALPHA)
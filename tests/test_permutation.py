@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+import loader
+import groups
+import contrasts
+import normalize
+import permutation
+
+
+# the example contrasts give the same results whatever the worker count
+@pytest.mark.parametrize('method, strata', [('permutation', 'PatientID'),
+                                            ('bootstrap', None)])
+def test_workers_agree(example, method, strata):
+    data, meta = example
+    wd, annot, header = loader.load_matrix(data, mmap=True, dtype=np.float64)
+    gi = groups.GroupIndex.from_files(meta, header)
+    wd = normalize.center(wd)
+    pairs = contrasts.one_factor_contrasts(gi.keys())
+    runs = [permutation.permutation_test(wd, gi, pairs, n_perm=200,
+                                         strata=strata, method=method,
+                                         min_obs=3, processes=processes)
+            for processes in (1, 2)]
+    for k in runs[0]:
+        assert np.array_equal(runs[0][k], runs[1][k], equal_nan=True)
+    assert runs[0]['fdr'].shape == (len(pairs), wd.shape[0])
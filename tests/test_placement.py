@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+import placement
+
+
+# random labels: nothing placed overlaps or leaves the bounds
+@pytest.mark.parametrize('n', [100, 1000])
+def test_no_overlaps(n):
+    rng = np.random.default_rng(0)
+    anchors = rng.uniform(0, 1000, (n, 2))
+    sizes = np.column_stack([rng.uniform(20, 60, n), np.full(n, 9.0)])
+    idx, offsets, align = placement.place(anchors, sizes,
+                                          priority=rng.random(n),
+                                          bounds=(0, 0, 1000, 1000),
+                                          marker=2.0)
+    assert len(idx) > 0
+    boxes = []
+    for i, (dx, dy), (ha, va) in zip(idx, offsets, align):
+        w, h = sizes[i]
+        x0 = anchors[i, 0] + dx - {'left': 0, 'center': w/2, 'right': w}[ha]
+        y0 = anchors[i, 1] + dy - {'bottom': 0, 'center': h/2, 'top': h}[va]
+        boxes.append((x0, y0, x0 + w, y0 + h))
+    b = np.array(boxes)
+    overlap = ((b[:, None, 0] < b[None, :, 2]) &
+               (b[None, :, 0] < b[:, None, 2]) &
+               (b[:, None, 1] < b[None, :, 3]) &
+               (b[None, :, 1] < b[:, None, 3]))
+    assert not overlap[~np.eye(len(b), dtype=bool)].any()
+    assert (b[:, :2] >= 0).all() and (b[:, 2:] <= 1000).all()
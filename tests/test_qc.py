@@ -0,0 +1,26 @@
+import csv
+import numpy as np
+import loader
+import qc
+
+
+# the single pass against the column-by-column numbers
+def test_summary_matches_columns(example, tmp_path):
+    wd, annot, header = loader.load_matrix(example[0], mmap=True)
+    summary = qc.summarize(wd, chunk_cols=5)
+    for i in range(wd.shape[1]):
+        x = np.asarray(wd[:, i], dtype=np.float64)
+        lx = np.log10(x[~np.isnan(x)])
+        q = np.percentile(lx, [25, 50, 75])
+        assert summary['present'][i] == len(lx)
+        assert np.allclose([summary[k][i] for k in
+                            ('min', 'max', 'mean', 'q1', 'median', 'q3')],
+                           [lx.min(), lx.max(), lx.mean(), q[0], q[1], q[2]])
+        assert summary['raw_median'][i] == np.median(x[~np.isnan(x)])
+        assert summary['hist'][i].sum() == len(lx)
+
+    path = str(tmp_path / 'qc_summary.csv')
+    qc.save_summary(path, summary, header[loader.N_ANNOT:])
+    with open(path, newline='') as f:
+        rows = list(csv.reader(f))
+    assert len(rows) == wd.shape[1] + 1
@@ -0,0 +1,30 @@
+import numpy as np
+import significance as sig
+
+
+# the classes against the per-point rules of the volcano plots
+def test_classes_match_volcano_rules():
+    rng = np.random.default_rng(0)
+    r = rng.normal(0, 2, (4, 5000))
+    lcp = rng.exponential(1.5, (4, 5000))
+    lcp[0, :10] = np.nan
+    lcp[1, :10] = 2
+    codes = sig.classify(r, lcp)
+    for i in range(len(r)):
+        for j in range(len(r[i])):
+            if lcp[i][j] > 2 and r[i][j] > 1:
+                expected = sig.UP
+            elif lcp[i][j] > 2 and r[i][j] < -1:
+                expected = sig.DOWN
+            elif lcp[i][j] < 2 and r[i][j] > 1:
+                expected = sig.UP_NS
+            elif lcp[i][j] < 2 and r[i][j] < -1:
+                expected = sig.DOWN_NS
+            else:
+                expected = sig.NONE
+            assert codes[i, j] == expected
+    table = sig.build_table(r, 10**-lcp, 10**-lcp,
+                            ['P{}'.format(j) for j in range(5000)],
+                            list('abcd'))
+    assert np.array_equal(table['class'], codes.ravel())
+    assert np.array_equal(table['log2fc'][sig.contrast_rows(table, 2)], r[2])
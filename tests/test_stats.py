@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import scipy.stats as sci_ss
+import stats
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(0)
+    return (rng.lognormal(12, 1, size=(2000, 8)),
+            rng.lognormal(12.3, 1.5, size=(2000, 6)), rng)
+
+
+@pytest.mark.parametrize('equal_var', [False, True])
+def test_ttest_ind_matches_scipy(samples, equal_var):
+    a, b, _ = samples
+    t, df, p = stats.ttest_ind(a, b, equal_var=equal_var)
+    for i in range(len(a)):
+        res = sci_ss.ttest_ind(a[i], b[i], equal_var=equal_var)
+        assert np.isclose(t[i], res[0], rtol=1e-10, atol=0)
+        assert np.isclose(p[i], res[1], rtol=1e-8, atol=1e-300)
+
+
+# ~30% of the values knocked out, against nan_policy='omit'
+@pytest.mark.parametrize('equal_var', [False, True])
+def test_nan_ttest_ind_matches_scipy(samples, equal_var):
+    a, b, rng = samples
+    a[rng.random(a.shape) < 0.3] = np.nan
+    b[rng.random(b.shape) < 0.3] = np.nan
+    t, df, p = stats.nan_ttest_ind(a, b, equal_var=equal_var, min_obs=3)
+    for i in range(len(a)):
+        ai = a[i][~np.isnan(a[i])]
+        bi = b[i][~np.isnan(b[i])]
+        if len(ai) < 3 or len(bi) < 3:
+            assert np.isnan(p[i])
+            continue
+        res = sci_ss.ttest_ind(ai, bi, equal_var=equal_var)
+        assert np.isclose(t[i], res[0], rtol=1e-10, atol=0)
+        assert np.isclose(p[i], res[1], rtol=1e-8, atol=1e-300)
@@ -0,0 +1,35 @@
+import os
+import csv
+import numpy as np
+import loader
+import store
+
+
+def read_rows(r_testing, name):
+    with open(os.path.join(r_testing, name), newline='') as f:
+        return list(csv.reader(f))
+
+
+def grow(rows, path, n):
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(r[:loader.N_ANNOT + n] for r in rows)
+
+
+# a changed old cell is not carried over by the appended store
+def test_changed_cell_rebuilds_store(r_testing, tmp_path):
+    rows = read_rows(r_testing, 'bmif-Example.csv')
+    data = str(tmp_path / 'grow.csv')
+    grow(rows, data, 16)
+    store.build_store(data, np.float64)
+    rows[5][loader.N_ANNOT] = '12345'
+    grow(rows, data, 28)
+    assert store.append_columns(data, np.float64) is None
+    rows = read_rows(r_testing, 'bmif-Example.csv')
+    grow(rows, data, 16)
+    store.build_store(data, np.float64)
+    grow(rows, data, 28)
+    assert list(store.append_columns(data, np.float64)) == list(range(16, 28))
+    wd = store.open_store(store.store_path(data), np.float64)[0]
+    ref = loader.load_matrix(data, use_cache=False, dtype=np.float64)[0]
+    assert wd.flags.f_contiguous
+    assert np.array_equal(wd, ref, equal_nan=True)
@@ -0,0 +1,84 @@
+import os
+import numpy as np
+import pytest
+import loader
+import validate
+
+GOOD_DATA = 'bmif-Example.csv'
+GOOD_META = 'Metadata-Example-2.csv'
+
+# the cases in R_testing/reworked_prepareInput.R, each with the error it
+#  should stop with or the size of what is left
+CASES = [
+    ('good files', GOOD_DATA, GOOD_META, 'Columns', (528, 32)),
+    ('missing data file', '000.csv', GOOD_META, 'Columns',
+     FileNotFoundError),
+    ('missing metadata file', GOOD_DATA, '000.csv', 'Columns',
+     FileNotFoundError),
+    ('empty data', 'bmif-Example_empty.csv', GOOD_META, 'Columns',
+     ValueError),
+    ('empty metadata', GOOD_DATA, 'Metadata-Example-2_empty.csv', 'Columns',
+     ValueError),
+    ('data headers only', 'bmif-Example_headers_only.csv', GOOD_META,
+     'Columns', ValueError),
+    ('metadata headers only', GOOD_DATA, 'Metadata-Example-2_headers_only.csv',
+     'Columns', ValueError),
+    ('wrong metadata column', GOOD_DATA, GOOD_META, 'ABC', ValueError),
+    ('data missing a column', 'bmif-Example_missing_column.csv', GOOD_META,
+     'Columns', (528, 31)),
+    ('no matching data columns', 'bmif-Example_bad_columns.csv', GOOD_META,
+     'Columns', ValueError),
+    ('no matching metadata columns', GOOD_DATA,
+     'Metadata-Example-2_bad_columns.csv', 'Columns', ValueError),
+    ('NA in metadata', GOOD_DATA, 'Metadata-Example-2_NA.csv', 'Columns',
+     (528, 31)),
+    ('blank cell', 'bmif-Example_blank_cell.csv', GOOD_META, 'Columns',
+     (528, 32)),
+    ('duplicated row', 'bmif-Example_duplicated_row.csv', GOOD_META,
+     'Columns', (528, 32)),
+    ('triplicate row', 'bmif-Example_triplicate_row.csv', GOOD_META,
+     'Columns', (528, 32)),
+    ('row of NA', 'bmif-Example_one_row_NA.csv', GOOD_META, 'Columns',
+     (527, 32)),
+    ('column of NA', 'bmif-Example_one_col_NA.csv', GOOD_META, 'Columns',
+     (527, 31)),
+    ('row and column of NA', 'bmif-Example_one_col_one_row_NA.csv',
+     GOOD_META, 'Columns', (527, 31)),
+    ('duplicated row and row of NA',
+     'bmif-Example_duplicated_row_one_row_NA.csv', GOOD_META, 'Columns',
+     (527, 32)),
+]
+
+
+@pytest.mark.parametrize('title, data, meta, meta_col, expected', CASES,
+                         ids=[c[0] for c in CASES])
+def test_r_cases(r_testing, title, data, meta, meta_col, expected):
+    data = os.path.join(r_testing, data)
+    meta = os.path.join(r_testing, meta)
+    if isinstance(expected, type):
+        with pytest.raises(expected):
+            validate.prepare_input(data, meta, meta_col, chunk_rows=100)
+    else:
+        result = validate.prepare_input(data, meta, meta_col, chunk_rows=100)
+        assert result['wd'].shape == expected
+
+
+# rows are numbered once duplicates are removed, as R does
+def test_removed_rows_numbered_after_duplicates(r_testing):
+    result = validate.prepare_input(
+        os.path.join(r_testing, 'bmif-Example_duplicated_row_one_row_NA.csv'),
+        os.path.join(r_testing, GOOD_META), chunk_rows=100)
+    assert 'Row indices removed: 399' in result['notes']
+    # while the kept rows are data file rows
+    assert 399 not in result['rows'] and 398 in result['rows']
+
+
+# the clean file gives the same numbers as the loader
+def test_clean_file_matches_loader(r_testing):
+    data = os.path.join(r_testing, GOOD_DATA)
+    wd, annot, header = loader.load_matrix(data, use_cache=False,
+                                           dtype=np.float64)
+    result = validate.prepare_input(data, os.path.join(r_testing, GOOD_META))
+    assert np.array_equal(result['wd'], wd[:, result['cols']],
+                          equal_nan=True)
+    assert np.array_equal(result['annot'], annot)
@@ -0,0 +1,142 @@
+import os
+import csv
+from itertools import islice
+import numpy as np
+import loader
+import groups
+
+# input checks, as prepareInput() in R_testing/reworked_prepareInput.R
+# same checks, messages and order of checks, but the data file is read
+#  once, chunk_rows lines at a time:
+#  - only the columns named in the metadata are converted
+#  - duplicate proteins (first column) are found with a set of the ids
+#    seen so far; the first occurrence is kept
+#  - rows with no values are dropped as they stream past, columns with
+#    no values at the end (from per-column counts)
+# problems that stop the import raise FileNotFoundError / ValueError;
+#  the notes R prints come back in the result instead
+
+
+def check_file(path, what):
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            '! {} file does not exist and/or path to file in incorrect ! '
+            '- verify and re-try'.format(what))
+    if os.path.getsize(path) == 0:
+        raise ValueError('! {} file is {} ! - verify file contents and '
+                         're-try'.format(what, 'empty' if what == 'Data'
+                                         else '0 bytes'))
+
+
+def no_data(what):
+    return ValueError('! {} file does not appear to contain any data ! - '
+                      'verify file contents and re-try'.format(what))
+
+
+# returns {'wd', 'annot', 'header', 'rows', 'cols', 'notes'}:
+#  the numeric data for the metadata samples (metadata order) with empty
+#  rows/columns removed, the annotation columns of the rows kept, the
+#  header of that table, the data file row and column index of every
+#  row and column kept, and the notes about what was changed
+def prepare_input(data_path, meta_path, meta_col='Columns',
+                  n_annot=loader.N_ANNOT, dtype=np.float64,
+                  chunk_rows=10000):
+    check_file(data_path, 'Data')
+    check_file(meta_path, 'Metadata')
+    notes = []
+
+    with open(data_path, newline='') as f:
+        # blank lines are skipped, as read.csv does
+        reader = (row for row in csv.reader(f) if row)
+        header = next(reader, None)
+        first = next(reader, None)
+        if header is None or first is None:
+            raise no_data('Data')
+
+        meta = groups.read_metadata(meta_path)
+        if len(next(iter(meta.values()))) < 1:
+            raise no_data('Metadata')
+        if meta_col not in meta:
+            raise ValueError('! Metadata file does NOT contain the column '
+                             'title passed in ! - verify input data and '
+                             're-try')
+
+        names = meta[meta_col]
+        is_na = np.isin(names, groups.META_NA_STRINGS)
+        if is_na.any():
+            notes.append('NA rows have been found in the metadata file and '
+                         'will be removed')
+            names = names[~is_na]
+
+        # the metadata samples found in the data, in metadata order
+        position = {}
+        for i, h in enumerate(header):
+            position.setdefault(h, i)
+        sel = list(dict.fromkeys(n for n in names if n in position))
+        if len(sel) < len(names):
+            notes.append('Not all columns indicated in the metadata file '
+                         'could be found in the data file')
+        if not sel:
+            raise ValueError('! No intersecting columns were found between '
+                             'the metadata file and the data file ! - '
+                             'verify input data and re-try')
+        sel_idx = np.array([position[n] for n in sel])
+
+        # one pass over the rows
+        seen = set()
+        duplicates = []
+        n_cols = len(header)
+        n_rows = n_unique = 0
+        col_counts = np.zeros(len(sel), dtype=np.int64)
+        blocks, annots, kept_rows, empty_rows = [], [], [], []
+        rows = [first] + list(islice(reader, chunk_rows - 1))
+        while rows:
+            body = np.array(rows, dtype=str).reshape(-1, n_cols)
+            ids = body[:, 0]
+
+            # first occurrence of every id not seen in an earlier chunk
+            uniq, first_idx = np.unique(ids, return_index=True)
+            new = np.array([u not in seen for u in uniq], dtype=bool)
+            seen.update(uniq[new].tolist())
+            keep = np.zeros(len(ids), dtype=bool)
+            keep[first_idx[new]] = True
+            duplicates.extend(ids[~keep].tolist())
+
+            x = loader.to_numeric(body[:, sel_idx], dtype)
+            present = ~np.isnan(x)
+            has_value = present.any(axis=1)
+            # numbered among the rows left once duplicates are removed,
+            #  as R does
+            unique_idx = n_unique + np.cumsum(keep) - 1
+            n_unique += keep.sum()
+            empty_rows.extend(unique_idx[keep & ~has_value].tolist())
+            keep &= has_value
+            col_counts += present[keep].sum(axis=0)
+
+            blocks.append(x[keep])
+            annots.append(body[keep, :n_annot])
+            kept_rows.append(n_rows + np.flatnonzero(keep))
+            n_rows += len(rows)
+            rows = list(islice(reader, chunk_rows))
+
+    if duplicates:
+        notes.append('The following protein(s) were found to have 2 (or '
+                     'more) times: {}; only the first occurrence has been '
+                     'kept'.format(', '.join(dict.fromkeys(duplicates))))
+
+    keep_cols = col_counts > 0
+    wd = np.concatenate(blocks)[:, keep_cols]
+    if empty_rows or not keep_cols.all():
+        notes.append('Some columns and/or rows have been removed')
+        if empty_rows:
+            notes.append('Row indices removed: {}'.format(
+                ' '.join(str(r + 1) for r in empty_rows)))
+        if not keep_cols.all():
+            notes.append('Column(s) removed: {}'.format(
+                ' '.join(np.array(sel)[~keep_cols])))
+
+    return {'wd': wd, 'annot': np.concatenate(annots),
+            'header': np.array(header[:n_annot] +
+                               [s for s, k in zip(sel, keep_cols) if k]),
+            'rows': np.concatenate(kept_rows),
+            'cols': sel_idx[keep_cols] - n_annot, 'notes': notes}